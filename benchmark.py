@@ -0,0 +1,333 @@
+"""
+Module: benchmark
+
+Measures how fast the pieces of a turn are, and how much memory a world
+takes, over a sweep of world sizes and critter densities, so that slowdowns
+that only show up in big or crowded worlds get noticed.
+
+Examples:
+    python benchmark.py --output results.json
+    python benchmark.py --baseline results.json  # fails if anything regressed
+    python benchmark.py --sizes 60x50 --densities 0.1 0.5 --csv results.csv
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+import tracemalloc
+
+from simulation import World, Simulation, pregnant_flag
+import critters
+
+default_sizes = [(60, 50), (250, 200), (1000, 1000), (4000, 4000)]
+default_densities = [0.01, 0.1, 0.5, 0.95]
+
+operations = ["do_turn", "draw", "gestate_critters", "get_open_spot",
+              "bury_critters"]
+
+
+def make_world(width, height, density, seed=0):
+    """
+    Returns a Simulation of a world with the given fraction of its spots
+    filled with critters.
+    """
+    world = World(width, height, 0.05, seed)
+    sim = Simulation(world)
+    num_each_type = \
+        int(density * width * height) // len(critters.critter_types)
+    sim.populate(critters.critter_types, num_each_type)
+    return sim
+
+
+def time_repeatedly(operation, min_time):
+    """
+    Calls operation (which returns how many things it did) until at least
+    min_time seconds have passed.
+
+    Returns (number of things done per second, seconds taken).
+    """
+    done = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < min_time:
+        done += operation()
+        elapsed = time.perf_counter() - start
+    return done / elapsed, elapsed
+
+
+def bench_do_turn(sim, min_time):
+    """ Times whole turns of the simulation. """
+    def operation():
+        sim.do_turn()
+        return 1
+    return time_repeatedly(operation, min_time)
+
+
+def bench_gestate_critters(sim, min_time):
+    """ Times births, with a tenth of the critters giving birth at once. """
+    world = sim.world
+
+    def operation():
+        # make a tenth of the critters give birth this turn, then take the
+        # babies out again so the world stays at the same density
+        mothers = [world.critter_id[c] for c in world.critters[::10]]
+        world.mating_until[mothers] = world.clock
+        world.critter_flags[mothers] |= pregnant_flag
+        for mother_id in mothers:
+            world.done_mating.schedule(world.clock, mother_id)
+        num_critters = len(world.critters)
+        start = time.perf_counter()
+        world.gestate_critters()
+        gestate_time = time.perf_counter() - start
+        babies = world.critters[num_critters:]
+        for baby in babies:
+            world.remove_critter(baby)
+        world.bury_critters(babies)
+        return max(1, len(babies)), gestate_time
+
+    done = 0
+    elapsed = 0
+    while elapsed < min_time:
+        born, gestate_time = operation()
+        done += born
+        elapsed += gestate_time
+    return done / elapsed, elapsed
+
+
+def bench_get_open_spot(sim, min_time):
+    """ Times picking random open spots. """
+    world = sim.world
+
+    def operation():
+        for _ in range(1000):
+            world.get_open_spot()
+        return 1000
+    return time_repeatedly(operation, min_time)
+
+
+def bench_bury_critters(sim, min_time):
+    """ Times burying critters, a tenth of the population at a time. """
+    world = sim.world
+
+    def operation():
+        # kill off a tenth of the critters, then bring the population back
+        # up so the world stays at the same density
+        dead = world.critters[::10]
+        if not dead:
+            return 1
+        for critter in dead:
+            world.remove_critter(critter)
+        start = time.perf_counter()
+        world.bury_critters(dead)
+        buried_time = time.perf_counter() - start
+        for critter in dead:
+            location = world.get_open_spot()
+            critter.move_to(*location)
+            world.add_critter(critter, location)
+        return len(dead), buried_time
+
+    done = 0
+    elapsed = 0
+    while elapsed < min_time:
+        buried, buried_time = operation()
+        done += buried
+        elapsed += buried_time
+    return done / elapsed, elapsed
+
+
+def bench_draw(sim, min_time):
+    """
+    Times redraws of a world on a tkinter canvas after each turn, leaving
+    out the turns themselves.
+    """
+    from tkinter import Tk, Canvas, TclError
+    import gui
+    try:
+        root = Tk()
+    except TclError:
+        return None
+    width, height = gui.canvas_size(sim.world)
+    canvas = Canvas(root, width=width, height=height)
+    renderer = gui.Renderer(canvas, sim.world)
+    renderer.draw(everything=True)
+
+    def operation():
+        sim.do_turn(notify=False)
+        start = time.perf_counter()
+        renderer.draw()
+        root.update_idletasks()
+        return time.perf_counter() - start
+
+    try:
+        done = 0
+        elapsed = 0
+        while elapsed < min_time:
+            elapsed += operation()
+            done += 1
+        return done / elapsed, elapsed
+    finally:
+        root.destroy()
+
+
+benchmarks = {
+    "do_turn": bench_do_turn,
+    "draw": bench_draw,
+    "gestate_critters": bench_gestate_critters,
+    "get_open_spot": bench_get_open_spot,
+    "bury_critters": bench_bury_critters,
+}
+
+
+def world_memory(width, height, density):
+    """
+    Returns the peak number of bytes allocated while making a world and
+    doing a turn of it. This is what the world itself takes, so it is the
+    same for every operation benchmarked on it.
+    """
+    tracemalloc.start()
+    try:
+        sim = make_world(width, height, density)
+        sim.do_turn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(sizes, densities, ops, min_time, max_critters):
+    """
+    Runs the given operations' benchmarks on worlds of every combination of
+    size and density, printing progress as it goes.
+
+    Returns a list of result dictionaries. Worlds with more than
+    max_critters critters are recorded as skipped rather than run.
+    """
+    # the first world made allocates some things that stay around (caches
+    # and the like), so get that out of the way before measuring anything
+    world_memory(10, 10, 0.5)
+
+    results = []
+    for width, height in sizes:
+        for density in densities:
+            num_critters = int(density * width * height)
+            case = {"width": width, "height": height, "density": density,
+                    "critters": num_critters}
+            if num_critters > max_critters:
+                for op in ops:
+                    results.append(dict(case, op=op,
+                                        skipped="too many critters"))
+                continue
+
+            memory = world_memory(width, height, density)
+            for op in ops:
+                result = dict(case, op=op, world_memory=memory)
+                rate = benchmarks[op](make_world(width, height, density),
+                                      min_time)
+                if rate is None:
+                    result["skipped"] = "no display"
+                else:
+                    result["rate"], result["seconds"] = rate
+                results.append(result)
+                print("%-16s %5dx%-5d %4.0f%%  %s" %
+                      (op, width, height, 100 * density,
+                       "skipped (%s)" % result["skipped"]
+                       if "skipped" in result else
+                       "%12.1f/s  %8.1f MB world" % (result["rate"],
+                                                     memory / 2**20)),
+                      file=sys.stderr)
+    return results
+
+
+def case_key(result):
+    """ Returns what identifies the benchmark a result is for. """
+    return (result["op"], result["width"], result["height"],
+            result["density"])
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of descriptions of the results that are more than
+    tolerance (a fraction) slower than the matching baseline results, and
+    of the worlds that take that much more memory.
+    """
+    baseline = {case_key(result): result for result in baseline}
+    regressions = []
+    worlds_checked = set()
+    for result in results:
+        old = baseline.get(case_key(result))
+        if old is None or "rate" not in result or "rate" not in old:
+            continue
+        world_name = "%dx%d %.0f%%" % (result["width"], result["height"],
+                                       100 * result["density"])
+        if result["rate"] < old["rate"] * (1 - tolerance):
+            regressions.append("%s %s: %.1f/s, was %.1f/s" %
+                               (result["op"], world_name, result["rate"],
+                                old["rate"]))
+
+        # (older results called the world's memory peak_memory)
+        memory = result["world_memory"]
+        old_memory = old.get("world_memory", old.get("peak_memory"))
+        if world_name not in worlds_checked and old_memory is not None and \
+                memory > old_memory * (1 + tolerance):
+            regressions.append("world memory %s: %.1f MB, was %.1f MB" %
+                               (world_name, memory / 2**20,
+                                old_memory / 2**20))
+        worlds_checked.add(world_name)
+    return regressions
+
+
+def parse_size(text):
+    """ Turns a size like "60x50" into a (width, height) tuple. """
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sizes", nargs="+", type=parse_size,
+                        default=default_sizes, metavar="WxH")
+    parser.add_argument("--densities", nargs="+", type=float,
+                        default=default_densities)
+    parser.add_argument("--ops", nargs="+", choices=operations,
+                        default=operations)
+    parser.add_argument("--min-time", type=float, default=1.0,
+                        help="seconds to spend timing each benchmark")
+    parser.add_argument("--max-critters", type=int, default=2000000,
+                        help="skip worlds with more critters than this")
+    parser.add_argument("--output", help="save results as JSON to this file")
+    parser.add_argument("--csv", help="save results as CSV to this file")
+    parser.add_argument("--baseline",
+                        help="JSON results to compare against; exits with "
+                             "an error if anything regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="how much worse than the baseline is allowed")
+    args = parser.parse_args(args)
+
+    results = run_benchmarks(args.sizes, args.densities, args.ops,
+                             args.min_time, args.max_critters)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, ["op", "width", "height", "density",
+                                        "critters", "rate", "seconds",
+                                        "world_memory", "skipped"])
+            writer.writeheader()
+            writer.writerows(results)
+    if not args.output and not args.csv:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION: " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Module: checkpoint
+
+Saves the complete state of a simulation to a compact binary file and loads
+it back, so a long run can be resumed where it left off, or many variations
+of an experiment can be started from the same point.
+
+A checkpoint file is laid out as:
+    - the 8 bytes b"CRITTERS" and the format version, as a 4 byte integer
+    - the length of the header, as a 4 byte integer, then the header itself:
+      JSON describing the world and where each section of the file is
+    - the sections, each starting on a 64 byte boundary: the food grid
+      packed 8 spots to a byte, the grid of critter ids, the ids of the
+      critters in order, each column of the critter table (see World), the
+      stats of each type, the world's open spots, and finally a pickle of
+      the critter objects, their classes, how food grows back and the random
+      number generators
+
+Because the grid of critter ids is stored as a plain array, it can be memory
+mapped instead of read in, which makes loading big worlds quick and lets
+many forked runs share the same pages until they change them.
+"""
+import io
+import json
+import os
+import pickle
+import struct
+
+import numpy as np
+
+from simulation import World, Simulation, critter_table
+
+magic = b"CRITTERS"
+version = 8
+alignment = 64
+
+
+def _aligned(offset):
+    """ Returns the first multiple of alignment at or after offset. """
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def save(sim, f):
+    """
+    Saves the given simulation to f, which is either the name of a file or a
+    binary file object.
+    """
+    if isinstance(f, (str, os.PathLike)):
+        with open(f, "wb") as file:
+            save(sim, file)
+        return
+
+    world = sim.world
+    num_ids = len(world.critter_by_id)
+    ids = np.array([world.critter_id[c] for c in world.critters],
+                   dtype=np.int32)
+    arrays = {
+        "food": np.packbits(world.food_grid.ravel()),
+        "occupants": world.occupant_grid,
+        "critter_ids": ids,
+    }
+    for name in critter_table:
+        arrays[name] = getattr(world, name)[:num_ids]
+    arrays.update({
+        "num_alive": world.num_alive,
+        "num_eaten": world.num_eaten,
+        "num_wins": world.num_wins,
+        "free_ids": np.array(world.free_ids, dtype=np.int32),
+        "open_cells": world.open_spots.cells[:len(world.open_spots)],
+    })
+    blob = pickle.dumps({
+        "critters": world.critters,
+        "critter_types": world.critter_types,
+        "food_growth": world.food_growth,
+        "random_state": world.random.getstate(),
+        "np_random_state": world.np_random.bit_generator.state,
+        "coin_flips": sim.coin_flips.numbers,
+    }, protocol=pickle.HIGHEST_PROTOCOL)
+
+    header = {
+        "width": world.width,
+        "height": world.height,
+        "food_probability": world.food_probability,
+        "seed": world.seed,
+        "food_coma_period": world.food_coma_period,
+        "food_comma_sleep_time": world.food_comma_sleep_time,
+        "gestation_period": world.gestation_period,
+        "turn_number": sim.turn_number,
+        "clock": world.clock,
+        "num_ids": num_ids,
+        "sections": {},
+    }
+
+    # the header says where the sections start, but where they can start
+    # depends on how long the header is, so keep laying the sections out
+    # further along until the header fits in front of them
+    start = 0
+    while True:
+        offset = start
+        for name, array in arrays.items():
+            header["sections"][name] = {"offset": offset,
+                                        "dtype": array.dtype.str,
+                                        "shape": array.shape}
+            offset = _aligned(offset + array.nbytes)
+        header["sections"]["pickle"] = {"offset": offset,
+                                        "length": len(blob)}
+        header_bytes = json.dumps(header).encode()
+        if 16 + len(header_bytes) <= start:
+            break
+        start = _aligned(16 + len(header_bytes) + alignment)
+
+    f.write(magic)
+    f.write(struct.pack("<II", version, len(header_bytes)))
+    f.write(header_bytes)
+    position = 16 + len(header_bytes)
+    for name, array in arrays.items():
+        offset = header["sections"][name]["offset"]
+        f.write(b"\0" * (offset - position))
+        f.write(np.ascontiguousarray(array).tobytes())
+        position = offset + array.nbytes
+    f.write(b"\0" * (header["sections"]["pickle"]["offset"] - position))
+    f.write(blob)
+
+
+def load(f, mmap=False, seed=None):
+    """
+    Returns the simulation saved in f, which is either the name of a file or
+    a binary file object.
+
+    If mmap is True (f has to be a file name then), the grid of critter ids
+    is memory mapped copy-on-write rather than read into memory.
+
+    If seed is given, the world's random number generators are reseeded
+    with it after loading, so that several runs forked from the same
+    checkpoint each play out differently.
+    """
+    if isinstance(f, (str, os.PathLike)):
+        with open(f, "rb") as file:
+            return _load(file, f if mmap else None, seed)
+    if mmap:
+        raise ValueError("Only checkpoints loaded by file name can be mapped.")
+    return _load(f, None, seed)
+
+
+def _load(f, mmap_path, seed):
+    """ Does the work of load, memory mapping from mmap_path if given. """
+    if f.read(len(magic)) != magic:
+        raise ValueError("Not a critters checkpoint.")
+    file_version, header_length = struct.unpack("<II", f.read(8))
+    if file_version != version:
+        raise ValueError("Unsupported checkpoint version %d." % file_version)
+    header = json.loads(f.read(header_length))
+    sections = header["sections"]
+
+    def read_array(name):
+        section = sections[name]
+        dtype = np.dtype(section["dtype"])
+        shape = tuple(section["shape"])
+        if mmap_path is not None and name == "occupants":
+            return np.memmap(mmap_path, dtype=dtype, mode="c",
+                             offset=section["offset"], shape=shape)
+        f.seek(section["offset"])
+        count = int(np.prod(shape))
+        data = bytearray(f.read(count * dtype.itemsize))
+        return np.frombuffer(data, dtype=dtype, count=count).reshape(shape)
+
+    f.seek(sections["pickle"]["offset"])
+    state = pickle.loads(f.read(sections["pickle"]["length"]))
+
+    width, height = header["width"], header["height"]
+    world = World(width, height, header["food_probability"], header["seed"],
+                  header["food_coma_period"], header["food_comma_sleep_time"],
+                  header["gestation_period"])
+    world.random.setstate(state["random_state"])
+    world.np_random.bit_generator.state = state["np_random_state"]
+
+    world.food_grid = np.unpackbits(read_array("food"),
+                                    count=width * height) \
+        .reshape(height, width).astype(bool)
+    world.num_food = int(np.count_nonzero(world.food_grid))
+    world.food_growth = state["food_growth"]
+    world.occupant_grid = read_array("occupants")
+
+    num_ids = header["num_ids"]
+    capacity = max(64, num_ids)
+    world.clock = header["clock"]
+    for name in critter_table:
+        column = np.zeros(capacity, dtype=getattr(world, name).dtype)
+        column[:num_ids] = read_array(name)
+        setattr(world, name, column)
+    world.free_ids = read_array("free_ids").tolist()
+
+    # put the timers still to go off back on the wheels
+    for critter_id in np.flatnonzero(world.wake_turn > world.clock).tolist():
+        world.waking.schedule(int(world.wake_turn[critter_id]), critter_id)
+    for critter_id in \
+            np.flatnonzero(world.mating_until > world.clock).tolist():
+        world.done_mating.schedule(int(world.mating_until[critter_id]),
+                                   critter_id)
+
+    world.critters = state["critters"]
+    world.critter_by_id = [None] * num_ids
+    ids = read_array("critter_ids").tolist()
+    for critter, critter_id in zip(world.critters, ids):
+        world.critter_by_id[critter_id] = critter
+        world.critter_id[critter] = critter_id
+        critter._world = world
+        critter.random = world.random
+
+    world.open_spots.reset(read_array("open_cells"))
+
+    for critter_type in state["critter_types"]:
+        world.register_type(critter_type)
+    world.num_alive = read_array("num_alive")
+    world.num_eaten = read_array("num_eaten")
+    world.num_wins = read_array("num_wins")
+
+    sim = Simulation(world)
+    sim.turn_number = header["turn_number"]
+    sim.coin_flips.numbers = state["coin_flips"]
+
+    if seed is not None:
+        reseed(sim, seed)
+    return sim
+
+
+def reseed(sim, seed):
+    """
+    Reseeds the random number generators of the given simulation's world
+    (in place, so everything holding on to them sees the change).
+    """
+    world = sim.world
+    world.seed = seed
+    world.random.seed(seed)
+    world.np_random.bit_generator.state = \
+        np.random.default_rng(seed).bit_generator.state
+    sim.coin_flips.numbers = []
+
+
+def copy(sim):
+    """ Returns an independent copy of the given simulation. """
+    buffer = io.BytesIO()
+    save(sim, buffer)
+    buffer.seek(0)
+    return load(buffer)
@@ -0,0 +1,213 @@
+"""
+Module: eventlog
+
+Records everything that happens in a simulation (moves, meals, critters
+falling asleep, matings, births, fights and food growing) to a compact
+binary log as it runs, so long runs can be analyzed or watched afterwards
+(see the replay module) without simulating them again.
+
+A log file starts with the 8 bytes b"CRITLOG\\0" and the format version, as
+a 4 byte integer. After that it is a stream of records, each starting with
+a byte saying what kind of record it is:
+    - MOVED, ATE, FELL_ASLEEP, MATED, BORN, FOUGHT and FOOD_GREW: an event,
+      giving the ids of the critters involved (if any) and whatever else is
+      needed to redo it
+    - TURN_DONE: the end of a turn, with the new turn number
+    - KEYFRAME: a checkpoint (see the checkpoint module) of the whole
+      simulation, written every keyframe_every turns so a replay can jump
+      straight to any part of the run
+    - INDEX: written when the log is closed, giving the number of the last
+      turn and listing the turn and position of every keyframe, followed by
+      where the index starts and the 8 bytes b"CRITIDX\\0"
+The events of a turn are in the order they happened. Critter ids are the
+world's (see World), and locations are stored in 2 bytes each, so logged
+worlds can be at most 65536 spots wide and high.
+"""
+import io
+import mmap
+import os
+import struct
+
+import checkpoint
+
+magic = b"CRITLOG\0"
+index_magic = b"CRITIDX\0"
+version = 2
+
+# kinds of record
+MOVED = 1
+ATE = 2
+FELL_ASLEEP = 3
+MATED = 4
+BORN = 5
+FOUGHT = 6
+TURN_DONE = 7
+KEYFRAME = 8
+INDEX = 9
+FOOD_GREW = 10
+
+# the layout of each kind of record (with a variable length part following
+# KEYFRAME and INDEX records)
+records = {
+    MOVED: struct.Struct("<BiHH"), # critter id, new x, new y
+    ATE: struct.Struct("<Bi"), # critter id
+    FELL_ASLEEP: struct.Struct("<Bi"), # critter id
+    MATED: struct.Struct("<Bii"), # mother id, father id
+    BORN: struct.Struct("<BiHH"), # mother id, baby's x, baby's y
+    # attacker id, defender id, their attack codes (0 if the defender was
+    # asleep and didn't fight) and whether the attacker won
+    FOUGHT: struct.Struct("<BiibbB"),
+    TURN_DONE: struct.Struct("<BI"), # new turn number
+    KEYFRAME: struct.Struct("<BIQ"), # turn number, checkpoint length
+    INDEX: struct.Struct("<BII"), # number of keyframes, last turn number
+    FOOD_GREW: struct.Struct("<BHH"), # x, y
+}
+index_entry = struct.Struct("<IQ") # turn number, position of keyframe
+footer = struct.Struct("<Q8s") # position of index, index_magic
+max_size = 2**16
+
+
+class EventLog:
+    """
+    Writes the events of a simulation to a log file for as long as it is
+    open. Opening a log starts it with a keyframe of the simulation as it is
+    now; close it once the run is over.
+    """
+
+    def __init__(self, sim, f, keyframe_every=1000):
+        """
+        Starts logging the given simulation to f, which is either the name of
+        a file or a binary file object, with a keyframe every keyframe_every
+        turns.
+        """
+        world = sim.world
+        if world.width > max_size or world.height > max_size:
+            raise ValueError("World is too big to be logged.")
+        if world.event_log is not None:
+            raise RuntimeError("Simulation is already being logged.")
+
+        if isinstance(f, (str, os.PathLike)):
+            f = open(f, "wb", buffering=2**20)
+            self.owns_file = True
+        else:
+            self.owns_file = False
+        self.f = f
+        self.world = world
+        self.keyframe_every = keyframe_every
+        self.keyframes = [] # (turn number, position) of each keyframe
+        self.turn_number = sim.turn_number
+
+        # write through bound methods, since there are a lot of events
+        write = f.write
+        self.write = write
+        self.pack_moved = records[MOVED].pack
+        self.pack_ate = records[ATE].pack
+        self.pack_fell_asleep = records[FELL_ASLEEP].pack
+        self.pack_mated = records[MATED].pack
+        self.pack_born = records[BORN].pack
+        self.pack_fought = records[FOUGHT].pack
+        self.pack_food_grew = records[FOOD_GREW].pack
+
+        write(magic + struct.pack("<I", version))
+        self.keyframe(sim)
+        world.event_log = self
+
+    def moved(self, critter_id, x, y):
+        self.write(self.pack_moved(MOVED, critter_id, x, y))
+
+    def ate(self, critter_id):
+        self.write(self.pack_ate(ATE, critter_id))
+
+    def fell_asleep(self, critter_id):
+        self.write(self.pack_fell_asleep(FELL_ASLEEP, critter_id))
+
+    def mated(self, mother_id, father_id):
+        self.write(self.pack_mated(MATED, mother_id, father_id))
+
+    def born(self, mother_id, x, y):
+        self.write(self.pack_born(BORN, mother_id, x, y))
+
+    def fought(self, attacker_id, defender_id, attack, defense,
+               attacker_won):
+        """
+        Records a fight, where attack and defense are the Attacks used (None
+        if the defender was asleep).
+        """
+        self.write(self.pack_fought(FOUGHT, attacker_id, defender_id,
+                                    attack.value if attack else 0,
+                                    defense.value if defense else 0,
+                                    attacker_won))
+
+    def food_grew(self, x, y):
+        self.write(self.pack_food_grew(FOOD_GREW, x, y))
+
+    def turn_done(self, sim):
+        """ Ends the current turn, writing a keyframe if one is due. """
+        self.turn_number = sim.turn_number
+        self.write(records[TURN_DONE].pack(TURN_DONE, sim.turn_number))
+        if sim.turn_number % self.keyframe_every == 0:
+            self.keyframe(sim)
+
+    def keyframe(self, sim):
+        """ Writes a checkpoint of the given simulation to the log. """
+        buffer = io.BytesIO()
+        checkpoint.save(sim, buffer)
+        data = buffer.getvalue()
+        self.keyframes.append((sim.turn_number, self.f.tell()))
+        self.write(records[KEYFRAME].pack(KEYFRAME, sim.turn_number,
+                                          len(data)))
+        self.write(data)
+
+    def close(self):
+        """
+        Stops logging, finishing the log off with an index of its
+        keyframes.
+        """
+        self.world.event_log = None
+        position = self.f.tell()
+        self.write(records[INDEX].pack(INDEX, len(self.keyframes),
+                                       self.turn_number))
+        for turn_number, keyframe_position in self.keyframes:
+            self.write(index_entry.pack(turn_number, keyframe_position))
+        self.write(footer.pack(position, index_magic))
+        self.f.flush()
+        if self.owns_file:
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_events(path):
+    """
+    Generates the events in the log at the given path, without replaying
+    them, as (turn number, kind of record, fields) tuples. The turn number
+    is that of the turn the event happened in (i.e. the turn number the
+    simulation had once it was done), and fields is the rest of the record.
+    """
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if data[:len(magic)] != magic:
+        raise ValueError("Not a critters event log.")
+
+    position = len(magic) + 4
+    turn_number = None
+    while position < len(data):
+        kind = data[position]
+        record = records[kind]
+        if position + record.size > len(data):
+            break # the log was cut off
+        fields = record.unpack_from(data, position)[1:]
+        position += record.size
+        if kind == KEYFRAME:
+            turn_number = fields[0] + 1
+            position += fields[1]
+        elif kind == TURN_DONE:
+            turn_number = fields[0] + 1
+        elif kind == INDEX:
+            break
+        else:
+            yield turn_number, kind, fields
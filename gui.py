@@ -0,0 +1,711 @@
+"""
+Module: gui
+
+The tkinter front end for Critters. It draws a Simulation's world and stats
+after every turn and lets the user start, stop, and tick the simulation.
+
+Worlds too big for the window can be scrolled around (drag with the mouse,
+or use the arrow keys) and zoomed (the mouse wheel, or + and -). Zoomed far
+out, the world is drawn as a heatmap of where the critters and food are.
+"""
+import io
+import time
+from tkinter import *
+from tkinter.font import Font
+
+import numpy as np
+
+from simulation import World, Simulation, total_points, alive_flag
+import checkpoint
+from replay import Replay
+from sandbox import Sandbox
+
+after_id = None
+root = None
+canvas = None
+renderer = None
+simulation = None
+budget = None # seconds each call into critter code gets, or None for no limit
+initial_state = None # checkpoint of the simulation before its first turn,
+                     # or None when playing back a log
+
+turn_time_ms = 1000
+
+# fast forwarding does turns in chunks of at most fast_forward_chunk_s
+# seconds, letting the window respond to the user in between chunks, and
+# only redraws every redraw_every turns (and at the end of each chunk).
+fast_forward_turns = 0 # how many turns are left to fast forward
+fast_forward_chunk_s = 0.05
+redraw_every = 100
+fast_forward_string = None
+
+turn_string = None
+
+# how many pixels wide a spot can be drawn (see Renderer). Spots are drawn
+# default_cell_size wide unless the world doesn't fit on the canvas, and as
+# text when they're at least text_cell_size wide.
+zoom_levels = (0.125, 0.25, 0.5, 1, 2, 4, 8, 14, 20, 28)
+default_cell_size = 14
+text_cell_size = 14
+
+# the biggest the canvas gets, in pixels. Bigger worlds are zoomed out or
+# scrolled around to see them.
+max_canvas_width = 840
+max_canvas_height = 700
+
+# where the mouse was last dragged to, while dragging the view around
+drag_from = None
+
+# the frame holding a stats panel for each type of critter, and the text of
+# each panel, indexed by type id
+stats_frame = None
+stats_strings = []
+panels_per_column = 8
+
+
+class Renderer:
+    """
+    Draws the part of a world that fits on a canvas, scrolled and zoomed in
+    or out however the user likes.
+
+    cell_size is how many pixels wide each spot is drawn, one of zoom_levels,
+    and (left, top) is the spot in the top left corner of the canvas. The
+    world wraps around at its edges, so the view does too.
+
+    Zoomed in, each spot on the canvas is drawn with text, as its own canvas
+    items (created the first time they're needed), and only the spots the
+    world reports as changed are updated. Zoomed out past text_cell_size, the
+    view is drawn as a heatmap instead: a single image, each pixel of which
+    is the average color of the spots it covers (green for empty spots,
+    purple for food and the color of each type of critter), made from the
+    world's arrays without looking at any critter objects.
+    """
+
+    def __init__(self, canvas, world):
+        self.canvas = canvas
+        self.world = world
+        self.width = int(canvas["width"])
+        self.height = int(canvas["height"])
+        self.left = 0
+        self.top = 0
+
+        # start zoomed in as far as fits the whole world on the canvas
+        self.cell_size = zoom_levels[0]
+        for cell_size in zoom_levels:
+            if cell_size <= default_cell_size and \
+                    cell_size * world.width <= self.width and \
+                    cell_size * world.height <= self.height:
+                self.cell_size = cell_size
+
+        # the colors of the heatmap, as (red, green, blue): those of empty
+        # spots and food, and a map from type id to that type's color
+        self.empty_color = self.rgb("lawn green")
+        self.food_color = self.rgb("DarkOrchid3")
+        self.type_colors = {}
+        self.image = None
+
+        self.clear_items()
+
+    def clear_items(self):
+        """
+        Throws away everything drawn, setting up to draw at the current
+        zoom.
+        """
+        self.canvas.delete(ALL)
+        self.image = None
+
+        # map from (column, row) on the canvas to the items drawn there
+        self.food_items = {}
+        self.critter_items = {}
+        self.status_items = {}
+
+        # map from (column, row) on the canvas to what was last drawn there,
+        # as a tuple of (has food, critter text, critter color, status text)
+        self.drawn = {}
+        self.created_items = False
+
+        if self.cell_size >= text_cell_size:
+            self.regular_font = Font(family="Arial", size=-self.cell_size)
+            self.small_font = Font(family="Arial",
+                                   size=-(self.cell_size // 2))
+            self.world.watch_changes()
+        else:
+            # the heatmap is redrawn from scratch every time anyway
+            self.world.stop_watching_changes()
+
+    def columns(self):
+        """ Returns how many columns of spots are in view. """
+        return self.spots_in_view(self.width, self.world.width)
+
+    def rows(self):
+        """ Returns how many rows of spots are in view. """
+        return self.spots_in_view(self.height, self.world.height)
+
+    def spots_in_view(self, pixels, spots):
+        """
+        Returns how many spots fit in the given number of pixels, at most
+        the given number of spots. Zoomed out past one spot per pixel, this
+        is a whole number of pixels' worth.
+        """
+        if self.cell_size >= 1:
+            return min(spots, -(-pixels // self.cell_size))
+        per_pixel = round(1 / self.cell_size)
+        return max(per_pixel, min(spots, pixels * per_pixel) //
+                   per_pixel * per_pixel)
+
+    def set_view(self, cell_size, left, top):
+        """
+        Shows the world with the given zoom and the spot (left, top) in the
+        top left corner.
+        """
+        if cell_size != self.cell_size:
+            self.cell_size = cell_size
+            self.clear_items()
+        self.left = left % self.world.width
+        self.top = top % self.world.height
+        self.draw(everything=True)
+
+    def zoom(self, steps, x, y):
+        """
+        Zooms in the given number of steps (or out, if negative) through
+        zoom_levels, keeping the spot at pixel (x, y) where it is.
+        """
+        level = zoom_levels.index(self.cell_size) + steps
+        cell_size = zoom_levels[max(0, min(level, len(zoom_levels) - 1))]
+        self.set_view(cell_size,
+                      int(self.left + x / self.cell_size - x / cell_size),
+                      int(self.top + y / self.cell_size - y / cell_size))
+
+    def scroll(self, columns, rows):
+        """ Moves the view the given number of spots right and down. """
+        self.set_view(self.cell_size, self.left + columns, self.top + rows)
+
+    def draw(self, everything=False):
+        """
+        Updates the canvas to match the world. Only spots that changed since
+        the last draw are looked at, unless everything is True.
+        """
+        if self.cell_size < text_cell_size:
+            self.draw_heatmap()
+            return
+
+        world = self.world
+        columns = self.columns()
+        rows = self.rows()
+        changed = world.take_changed_spots()
+        if everything:
+            cells = [(column, row) for row in range(rows)
+                     for column in range(columns)]
+        else:
+            cells = []
+            for x, y in changed:
+                column = (x - self.left) % world.width
+                row = (y - self.top) % world.height
+                if column < columns and row < rows:
+                    cells.append((column, row))
+
+        self.created_items = False
+        for column, row in cells:
+            self.draw_cell(column, row)
+
+        # items are created as they are needed, so put them back in order:
+        # food, then critter, then sleeping or mating embellishment on top
+        if self.created_items:
+            self.canvas.tag_raise("critter")
+            self.canvas.tag_raise("status")
+
+    def draw_cell(self, column, row):
+        """
+        Brings the drawing of the spot shown at the given column and row of
+        the canvas up to date.
+        """
+        world = self.world
+        x = (self.left + column) % world.width
+        y = (self.top + row) % world.height
+        has_food = world.food_at(x, y)
+        critter = world.get_critter(x, y)
+        if critter is None:
+            look = (has_food, None, None, None)
+        else:
+            # add embellishment to indicate critter is sleeping or mating
+            if world.is_sleeping(critter):
+                status = "ZZz"
+            elif world.is_mating(critter):
+                status = "<3"
+            else:
+                status = None
+            look = (has_food, str(critter), critter.get_color(), status)
+
+        cell = (column, row)
+        if self.drawn.get(cell) == look:
+            return
+        self.drawn[cell] = look
+
+        self.show_item(self.food_items, cell, "food", self.regular_font,
+                       "." if has_food else None, "DarkOrchid3")
+        self.show_item(self.critter_items, cell, "critter",
+                       self.regular_font, look[1], look[2])
+        self.show_item(self.status_items, cell, "status", self.small_font,
+                       look[3], "black" if look[3] == "ZZz" else "red")
+
+    def show_item(self, items, cell, tag, font, text, color):
+        """
+        Shows the given text in the given (column, row) of the canvas using
+        that cell's item from items, or hides that item if text is None.
+        """
+        item = items.get(cell)
+        if text is None:
+            if item is not None:
+                self.canvas.itemconfigure(item, state=HIDDEN)
+        elif item is None:
+            size = self.cell_size
+            items[cell] = self.canvas.create_text(
+                size * cell[0] + size // 2, size * cell[1] + size // 2,
+                text=text, font=font, fill=color, tags=tag)
+            self.created_items = True
+        else:
+            self.canvas.itemconfigure(item, text=text, fill=color,
+                                      state=NORMAL)
+
+    def rgb(self, color):
+        """ Returns the (red, green, blue) of the given tkinter color. """
+        red, green, blue = self.canvas.winfo_rgb(color)
+        return red >> 8, green >> 8, blue >> 8
+
+    def palette(self):
+        """
+        Returns an array of the heatmap's colors: empty spots, food, then
+        each type of critter by type id.
+        """
+        world = self.world
+        colors = [self.empty_color, self.food_color]
+        for type_id in range(len(world.critter_types)):
+            color = self.type_colors.get(type_id)
+            if color is None:
+                # a critter type's color is that of whichever of its
+                # critters comes first. One that has none left can't be
+                # seen, so its color can wait until it has some again.
+                of_type = (world.critter_type == type_id) & \
+                    (world.critter_flags & alive_flag).astype(bool)
+                critter_id = int(of_type.argmax())
+                if of_type[critter_id]:
+                    color = self.rgb(
+                        world.critter_by_id[critter_id].get_color())
+                    self.type_colors[type_id] = color
+                else:
+                    color = self.empty_color
+            colors.append(color)
+        return np.array(colors, dtype=np.uint8)
+
+    def in_view(self, grid, columns, rows):
+        """
+        Returns the part of the given height x width array of the world that
+        is in view, columns wide and rows high, wrapping around its edges.
+        """
+        world = self.world
+        if self.top + rows > world.height:
+            grid = grid.take((self.top + np.arange(rows)) % world.height,
+                             axis=0)
+        else:
+            grid = grid[self.top:self.top + rows]
+        if self.left + columns > world.width:
+            grid = grid.take((self.left + np.arange(columns)) % world.width,
+                             axis=1)
+        else:
+            grid = grid[:, self.left:self.left + columns]
+        return grid
+
+    def heatmap(self):
+        """
+        Returns the heatmap of the view, as a height x width x 3 array of
+        pixel colors.
+        """
+        world = self.world
+        columns = self.columns()
+        rows = self.rows()
+        occupants = self.in_view(world.occupant_grid, columns, rows)
+        food = self.in_view(world.food_grid, columns, rows)
+
+        # each spot's shade, its color's place in the palette: 0 for empty,
+        # 1 for food and 2 plus the type id for a critter
+        shade_of = np.zeros(len(world.critter_type) + 1, dtype=np.uint16)
+        shade_of[1:] = world.critter_type + 2
+        shades = np.maximum(shade_of.take(occupants + 1),
+                            food.astype(np.uint16))
+        palette = self.palette()
+
+        if self.cell_size >= 1:
+            pixels = palette[shades]
+            if self.cell_size > 1:
+                pixels = pixels.repeat(self.cell_size, axis=0) \
+                    .repeat(self.cell_size, axis=1)
+            return pixels
+
+        # average the colors of each square of spots that shares a pixel,
+        # one channel at a time: add up the rows of each square, then the
+        # columns. Adding a slice at a time is much quicker than sum().
+        per_pixel = round(1 / self.cell_size)
+        height = rows // per_pixel
+        width = columns // per_pixel
+        pixels = np.empty((height, width, 3), dtype=np.uint8)
+        for channel in range(3):
+            spots = palette[:, channel].take(shades) \
+                .reshape(height, per_pixel, columns)
+            row_totals = np.zeros((height, columns), dtype=np.uint16)
+            for i in range(per_pixel):
+                row_totals += spots[:, i]
+            row_totals = row_totals.reshape(height, width, per_pixel)
+            total = np.zeros((height, width), dtype=np.uint16)
+            for j in range(per_pixel):
+                total += row_totals[:, :, j]
+            pixels[:, :, channel] = total // per_pixel**2
+        return pixels
+
+    def draw_heatmap(self):
+        """
+        Draws the heatmap of the view, handing it to tkinter as a binary PPM
+        image.
+        """
+        pixels = self.heatmap()
+        height, width = pixels.shape[:2]
+        data = b"P6 %d %d 255\n" % (width, height) + pixels.tobytes()
+        if self.image is None:
+            self.image = PhotoImage(master=self.canvas, width=width,
+                                    height=height, data=data, format="PPM")
+            self.canvas.create_image(0, 0, anchor=NW, image=self.image,
+                                     tags="heatmap")
+        else:
+            self.image.configure(width=width, height=height, data=data,
+                                 format="PPM")
+
+
+def stats_text(world, critter_type):
+    """ Returns the text for the stats panel of the given critter type. """
+    alive, kills, eaten = world.get_stats(critter_type)
+    return "Alive: %d\nKills: %d\nEaten: %d\nPoints: %d" % \
+        (alive, kills, eaten, total_points(alive, kills, eaten))
+
+
+def update_window(sim):
+    """
+    Simulation observer that shows the outcome of the latest turn: the turn
+    count, the stats in the right side of the window, and the world itself.
+    """
+    turn_string.set("Turn: " + str(sim.turn_number))
+
+    world = sim.world
+    for critter_type in world.critter_types[len(stats_strings):]:
+        add_stats_panel(critter_type.__name__)
+    for critter_type, stats_string in zip(world.critter_types, stats_strings):
+        stats_string.set(stats_text(world, critter_type))
+
+    if sim.metrics is None:
+        renderer.draw()
+    else:
+        start = time.perf_counter()
+        renderer.draw()
+        sim.metrics.add_time("draw", time.perf_counter() - start)
+
+
+def adjust_turn_time(scalar):
+    """ Adjusts the amount of ms for each turn. """
+    global turn_time_ms
+    turn_time_ms = 1000 // int(scalar)
+
+
+def do_turn():
+    """ Performs a single turn of the simulation. """
+    simulation.do_turn()
+
+
+def create_window():
+    """ Returns a new GUI window. """
+    root = Tk()
+    root.title("Critters Simulator")
+    root.geometry("975x750")
+
+    # make sure this pops in front of all other windows
+    root.lift()
+    root.attributes("-topmost", True)
+    root.grid_propagate(0)
+
+    # Set up the frame where the world canvase will go
+    canvas_frame = Frame(root)
+    canvas_frame.grid(row=0, column=0)
+
+    # set up frame with controls and turn count (bottom part of window)
+    controls = Frame(root)
+    controls.grid(row=1, column=0)
+
+    turn_speed_slider = Scale(controls, from_=1, to=10, label="Turn Speed",
+                              showvalue=0, orient=HORIZONTAL,
+                              command=adjust_turn_time)
+    turn_speed_slider.grid(row=0, column=0)
+
+    global turn_string
+    turn_string = StringVar()
+    turn_string.set("Turn: 0")
+    turn_label = Label(controls, textvariable=turn_string)
+    turn_label.grid(row=0, column=1)
+
+    start_button = Button(controls, text="Start", command=sim_loop)
+    start_button.grid(row=0, column=2)
+    stop_button = Button(controls, text="Stop", command=stop_sim_loop)
+    stop_button.grid(row=0, column=3)
+    tick_button = Button(controls, text="Tick", command=do_turn)
+    tick_button.grid(row=0, column=4)
+
+    global fast_forward_string
+    fast_forward_string = StringVar()
+    fast_forward_string.set("1000")
+    fast_forward_entry = Entry(controls, textvariable=fast_forward_string,
+                               width=6)
+    fast_forward_entry.grid(row=0, column=5)
+    fast_forward_button = Button(controls, text="Fast Forward",
+                                 command=fast_forward)
+    fast_forward_button.grid(row=0, column=6)
+
+    reset_button = Button(controls, text="Reset", command=reset_simulation)
+    reset_button.grid(row=0, column=7)
+
+    # set up the frame with simulation stats, to go on the right side of the
+    # window. It gets a panel for each type of critter once the world has
+    # some (see add_stats_panel).
+    global stats_frame
+    stats_frame = Frame(root, width=200)
+    stats_frame.grid(row=0, column=1, rowspan=2, padx=15, sticky=N)
+    stats_strings.clear()
+
+    return root, canvas_frame
+
+
+def add_stats_panel(name):
+    """
+    Adds a panel for the stats of the next type of critter, filling
+    columns of panels_per_column panels from left to right.
+    """
+    i = len(stats_strings)
+    panel = LabelFrame(stats_frame, text=name, width=100)
+    panel.grid(row=i % panels_per_column, column=i // panels_per_column,
+               sticky=EW)
+    stats_string = StringVar()
+    stats_string.set("Alive: \nKills: \nEaten: \nPoints: ")
+    stats = Label(panel, textvariable=stats_string, justify=LEFT)
+    stats.pack(fill='x', expand=True)
+    stats_strings.append(stats_string)
+
+
+def sim_loop():
+    """
+    Starts doing turns of the simulation, waiting turn_time_ms between each
+    turn.
+    """
+    global after_id
+    stop_sim_loop()
+    do_turn()
+    after_id = root.after(turn_time_ms, sim_loop)
+
+def fast_forward():
+    """
+    Starts doing the number of turns given in the fast forward box as quickly
+    as possible.
+    """
+    global fast_forward_turns
+    stop_sim_loop()
+    try:
+        fast_forward_turns = int(fast_forward_string.get())
+    except ValueError:
+        return
+    fast_forward_chunk()
+
+def fast_forward_chunk():
+    """
+    Does the next chunk of fast forward turns, then schedules the chunk
+    after it for once the window has caught up with any user input.
+    """
+    global after_id
+    global fast_forward_turns
+    fast_forward_turns -= simulation.run(num_turns=fast_forward_turns,
+                                         time_limit=fast_forward_chunk_s,
+                                         notify_every=redraw_every)
+    if fast_forward_turns > 0:
+        after_id = root.after_idle(fast_forward_chunk)
+    else:
+        after_id = None
+
+def stop_sim_loop():
+    """ Stops the simulation from doing more turns. """
+    global after_id
+    if after_id:
+        root.after_cancel(after_id)
+        after_id = None
+
+def reset_simulation():
+    """
+    Resets the simulator to the state it started in, by loading the
+    checkpoint saved before the first turn (or going back to the start of
+    the log being played back).
+    """
+    global simulation
+    global fast_forward_turns
+    stop_sim_loop()
+    fast_forward_turns = 0
+
+    if initial_state is None:
+        simulation.seek(simulation.first_turn)
+    else:
+        old_sandbox = simulation.sandbox
+        simulation = checkpoint.load(io.BytesIO(initial_state))
+        simulation.add_observer(update_window)
+        if old_sandbox is not None:
+            old_sandbox.close()
+            Sandbox(simulation, budget)
+    show_world()
+
+
+def show_world():
+    """
+    Draws the simulation's world on the canvas from scratch, keeping the
+    view where it was.
+    """
+    global renderer
+    old_renderer = renderer
+    renderer = Renderer(canvas, simulation.world)
+    if old_renderer is None:
+        renderer.draw(everything=True)
+    else:
+        renderer.set_view(old_renderer.cell_size, old_renderer.left,
+                          old_renderer.top)
+    update_window(simulation)
+
+
+def canvas_size(world):
+    """
+    Returns the (width, height) of the canvas to draw the given world on:
+    big enough for the whole world at default_cell_size, if that fits.
+    """
+    return min(default_cell_size * world.width, max_canvas_width), \
+        min(default_cell_size * world.height, max_canvas_height)
+
+
+def create_canvas(canvas_frame, world):
+    """
+    Creates the canvas the given world is drawn on. The view can be dragged
+    around with the mouse or arrow keys and zoomed with the mouse wheel or
+    the + and - keys.
+    """
+    global canvas
+    width, height = canvas_size(world)
+    canvas = Canvas(canvas_frame, bg="lawn green", height=height,
+                    width=width, bd=0, relief='sunken',
+                    highlightthickness=0)
+    canvas.pack()
+
+    canvas.bind("<ButtonPress-1>", start_drag)
+    canvas.bind("<B1-Motion>", drag_view)
+    canvas.bind("<MouseWheel>", zoom_view)
+    canvas.bind("<Button-4>", zoom_view)
+    canvas.bind("<Button-5>", zoom_view)
+    for key, columns, rows in (("<Left>", -1, 0), ("<Right>", 1, 0),
+                               ("<Up>", 0, -1), ("<Down>", 0, 1)):
+        canvas.bind(key, lambda event, columns=columns, rows=rows:
+                    scroll_view(columns, rows))
+    canvas.bind("<plus>", lambda event: renderer.zoom(1, 0, 0))
+    canvas.bind("<equal>", lambda event: renderer.zoom(1, 0, 0))
+    canvas.bind("<minus>", lambda event: renderer.zoom(-1, 0, 0))
+
+
+def start_drag(event):
+    """ Starts dragging the view around, taking the keyboard focus. """
+    global drag_from
+    canvas.focus_set()
+    drag_from = (event.x, event.y)
+
+
+def drag_view(event):
+    """ Scrolls the view along with the mouse, a whole spot at a time. """
+    global drag_from
+    size = renderer.cell_size
+    columns = int((drag_from[0] - event.x) / size)
+    rows = int((drag_from[1] - event.y) / size)
+    if columns or rows:
+        renderer.scroll(columns, rows)
+        drag_from = (drag_from[0] - columns * size,
+                     drag_from[1] - rows * size)
+
+
+def scroll_view(columns, rows):
+    """
+    Scrolls the view a tenth of the way across the canvas in the given
+    direction.
+    """
+    across = max(1, int(renderer.width / renderer.cell_size) // 10)
+    down = max(1, int(renderer.height / renderer.cell_size) // 10)
+    renderer.scroll(columns * across, rows * down)
+
+
+def zoom_view(event):
+    """ Zooms in or out around the mouse as the mouse wheel turns. """
+    if event.num == 4 or event.delta > 0:
+        renderer.zoom(1, event.x, event.y)
+    elif event.num == 5 or event.delta < 0:
+        renderer.zoom(-1, event.x, event.y)
+
+
+def simulate(world_width, world_height, num_each_type, types, seed=None,
+             call_budget=None):
+    """
+    Perform simulation of a world with num_each_type of each of the given
+    types of critters. Giving a seed replays the same simulation every time.
+
+    Giving a call_budget runs the critters in a sandbox.Sandbox with that
+    many seconds per call, so one stuck in a loop can't freeze the window,
+    and prints what each type of critter cost when the window is closed.
+    """
+    global root
+    root, canvas_frame = create_window()
+
+    global budget
+    budget = call_budget
+
+    world = World(world_width, world_height, 0.05, seed)
+    root.title("Critters Simulator (seed %d)" % world.seed)
+    create_canvas(canvas_frame, world)
+
+    global simulation
+    simulation = Simulation(world)
+    simulation.populate(types, num_each_type)
+    simulation.add_observer(update_window)
+
+    global initial_state
+    buffer = io.BytesIO()
+    checkpoint.save(simulation, buffer)
+    initial_state = buffer.getvalue()
+
+    if budget is not None:
+        Sandbox(simulation, budget)
+    show_world()
+    root.mainloop()
+    if simulation.sandbox is not None:
+        simulation.sandbox.print_report()
+        simulation.sandbox.close()
+
+
+def play_back(path, turn=0):
+    """
+    Plays back the event log at the given path (see the replay module),
+    starting at the given turn. The controls work just like they do for a
+    live simulation.
+    """
+    global root
+    root, canvas_frame = create_window()
+    root.title("Critters Simulator (replaying %s)" % path)
+
+    global simulation
+    simulation = Replay(path)
+    simulation.seek(turn)
+    simulation.add_observer(update_window)
+
+    create_canvas(canvas_frame, simulation.world)
+    show_world()
+    root.mainloop()
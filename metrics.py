@@ -0,0 +1,159 @@
+"""
+Module: metrics
+
+Keeps a time series of how a simulation is going: after every turn, each
+critter type's alive/kills/eaten counts, how many critters were born and
+died, how much food is left, and how long each phase of the turn took.
+
+The series is kept in NumPy arrays allocated up front and used as ring
+buffers, so recording a turn doesn't allocate anything and long runs keep
+just their most recent turns. A simulation without metrics attached pays
+nothing more than a few checks of simulation.metrics per turn.
+
+Example:
+    metrics = Metrics(sim)
+    sim.run(10000)
+    metrics.save_csv("run.csv")
+"""
+import csv
+
+import numpy as np
+
+# the phases of a turn that are timed. "food" is food growing back (see
+# FoodGrowth), "decide" covers batch policies and every critter's get_move,
+# "combat" every fight (choosing attacks included), "draw" is reported by
+# the display (see add_time) and "turn" is the whole turn, drawing aside.
+phases = ("food", "rest", "gestate", "decide", "combat", "bury", "draw",
+          "turn")
+
+
+class Metrics:
+    """
+    Records the stats of the given simulation after each of its turns,
+    keeping the last capacity turns.
+
+    Each column of the series is an array named after what it holds:
+    "turn", "births", "deaths", "food", "alive_<type>", "kills_<type>",
+    "eaten_<type>" and "<phase>_s" (seconds spent in each phase).
+    """
+
+    def __init__(self, sim, capacity=100000):
+        """ Starts recording the given simulation's turns. """
+        self.sim = sim
+        self.capacity = capacity
+        self.count = 0 # number of turns recorded, including overwritten ones
+        self.columns = {}
+        for name in ("turn", "births", "deaths", "food"):
+            self.add_column(name, np.int64)
+        for phase in phases:
+            self.add_column(phase + "_s", np.float64)
+        self.type_names = []
+        self.add_types()
+
+        world = sim.world
+        self.last_alive = int(world.num_alive.sum())
+        self.last_kills = int(world.num_wins.sum())
+        sim.metrics = self
+
+    def add_column(self, name, dtype):
+        """ Adds a column of zeros. """
+        self.columns[name] = np.zeros(self.capacity, dtype=dtype)
+
+    def add_types(self):
+        """ Adds columns for any critter types not seen before. """
+        for critter_type in \
+                self.sim.world.critter_types[len(self.type_names):]:
+            name = critter_type.__name__
+            if "alive_" + name in self.columns:
+                # a different class with the same name
+                name += "_%d" % len(self.type_names)
+            self.type_names.append(name)
+            for stat in ("alive_", "kills_", "eaten_"):
+                self.add_column(stat + name, np.int64)
+
+    def record_turn(self, **times):
+        """
+        Records the simulation's stats now that a turn is done, along with
+        the number of seconds the turn spent in each of the given phases.
+        """
+        sim = self.sim
+        world = sim.world
+        row = self.count % self.capacity
+        columns = self.columns
+
+        if len(world.critter_types) != len(self.type_names):
+            self.add_types()
+        for type_id, name in enumerate(self.type_names):
+            columns["alive_" + name][row] = world.num_alive[type_id]
+            columns["kills_" + name][row] = world.num_wins[type_id]
+            columns["eaten_" + name][row] = world.num_eaten[type_id]
+
+        # every death is someone else's kill, and the rest of the change in
+        # population is births
+        alive = int(world.num_alive.sum())
+        kills = int(world.num_wins.sum())
+        deaths = kills - self.last_kills
+        columns["turn"][row] = sim.turn_number
+        columns["deaths"][row] = deaths
+        columns["births"][row] = alive - self.last_alive + deaths
+        columns["food"][row] = world.food_remaining()
+        self.last_alive = alive
+        self.last_kills = kills
+
+        for phase in phases:
+            columns[phase + "_s"][row] = times.get(phase, 0.0)
+        self.count += 1
+
+    def add_time(self, phase, seconds):
+        """
+        Adds time spent in the given phase to the latest turn recorded, for
+        phases that happen outside of the turn itself (like drawing).
+        """
+        if self.count:
+            row = (self.count - 1) % self.capacity
+            self.columns[phase + "_s"][row] += seconds
+
+    def __len__(self):
+        """ Returns the number of turns currently held. """
+        return min(self.count, self.capacity)
+
+    def series(self):
+        """
+        Returns a dictionary mapping each column's name to an array of its
+        values for the turns held, oldest first.
+        """
+        if self.count <= self.capacity:
+            return {name: column[:self.count].copy()
+                    for name, column in self.columns.items()}
+        start = self.count % self.capacity
+        return {name: np.concatenate((column[start:], column[:start]))
+                for name, column in self.columns.items()}
+
+    def phase_summary(self):
+        """
+        Returns a dictionary mapping each phase to the total seconds spent
+        in it over the turns held.
+        """
+        series = self.series()
+        return {phase: float(series[phase + "_s"].sum()) for phase in phases}
+
+    def save_csv(self, path):
+        """ Saves the series to a CSV file, one row per turn. """
+        series = self.series()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(series.keys())
+            writer.writerows(zip(*(column.tolist()
+                                   for column in series.values())))
+
+    def save_columns(self, path):
+        """
+        Saves the series column by column to a NumPy .npz file, which loads
+        back (with numpy.load) as a mapping from column name to array.
+        """
+        np.savez_compressed(path, **self.series())
+
+    def detach(self):
+        """ Stops recording the simulation's turns. """
+        if self.sim.metrics is self:
+            self.sim.metrics = None
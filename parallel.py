@@ -0,0 +1,1151 @@
+"""
+Module: parallel
+
+Spreads the work of a turn over several processes, so that big worlds
+aren't stuck on one core.
+
+The world is cut into square tiles, which are shared out between worker
+processes in runs of neighboring tiles. Each worker holds on to the
+critters in its tiles for as long as they stay there, and the world's grids
+and critter table live in shared memory, so the workers read and write them
+directly. The only critters sent between processes are those crossing into
+another worker's tiles and those being born.
+
+A turn goes like this:
+    - the main process grows food, wakes critters up and finds a spot for
+      each baby about to be born; the workers spawn the babies and hand
+      over the critters that moved into another worker's tiles last turn
+    - in each tile, the critters eat and decide their moves, all from the
+      world as it was at the start of the turn, like critters with batch
+      policies do (see Critter.get_moves). The moves that start and end
+      inside the tile, away from its edges, are then made right there, one
+      critter at a time in order of id, fights and matings included. Since
+      nothing else in the turn can reach those spots, the tiles don't get
+      in each other's way
+    - the moves that start or end on the edge of a tile are made in the
+      main process, in the world's usual order, which settles any conflicts
+      between tiles the same way every time. The attacks for those fights
+      are picked in the workers beforehand, against whoever was in the way
+      at the start of the turn; a critter that finds someone else in its
+      way by the time its move comes up only mates with them (if they're
+      the same kind of critter), and otherwise stays where it is
+
+Each tile gets its own random number generators for the turn, seeded from
+the world's, so a run is the same however many workers there are. The one
+exception is critters sharing mutable values through inherited_fields:
+they only go on sharing them while the same worker holds all of them.
+
+The critter objects in the main process are only brought up to date when
+sync is called, which happens before observers are told about a turn,
+before an event log writes a keyframe and on close; call it before saving
+a checkpoint. Critters in the workers can't be sandboxed, so attaching a
+sandbox.Sandbox to a ParallelSimulation raises an error.
+"""
+import multiprocessing
+import os
+import pickle
+import random
+import time
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from simulation import Simulation, Neighbors, Batch, Direction, battle, \
+    critter_table, alive_flag, pregnant_flag, directions_by_code, \
+    attacks_by_code
+
+
+class SharedArray:
+    """ A NumPy array kept in shared memory, so other processes can see it. """
+
+    def __init__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * dtype.itemsize)
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.memory.buf)
+
+    def describe(self):
+        """ Returns what a worker needs to find the array. """
+        return self.memory.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        """ Frees the shared memory. """
+        del self.array
+        self.memory.close()
+        self.memory.unlink()
+
+
+# shared memory the worker process has attached to, by name
+_attached = {}
+
+
+def _attach(description):
+    """ Returns the shared array with the given description (see describe). """
+    name, shape, dtype = description
+    memory = _attached.get(name)
+    if memory is None:
+        memory = shared_memory.SharedMemory(name=name)
+        _attached[name] = memory
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+
+
+def _detach_except(names):
+    """ Lets go of any shared memory other than that with the given names. """
+    for name in list(_attached):
+        if name not in names:
+            _attached.pop(name).close()
+
+
+# the world arrays kept in shared memory
+shared_arrays = ("occupant_grid", "food_grid") + critter_table
+
+
+class Tiling:
+    """ How a width x height world is cut into tile_size x tile_size tiles. """
+
+    def __init__(self, width, height, tile_size):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.tiles_across = -(-width // tile_size)
+        self.num_tiles = self.tiles_across * -(-height // tile_size)
+
+    def tile_of(self, x, y):
+        """
+        Returns the number of the tile the spot (x, y) is in. Works on
+        arrays of spots too.
+        """
+        size = self.tile_size
+        return (y // size) * self.tiles_across + x // size
+
+    def on_edge(self, x, y):
+        """
+        Returns an array saying whether each of the given spots is on the
+        edge of its tile.
+        """
+        size = self.tile_size
+        x_in_tile = x % size
+        y_in_tile = y % size
+        return (x_in_tile == 0) | (x_in_tile == size - 1) | \
+            (x == self.width - 1) | (y_in_tile == 0) | \
+            (y_in_tile == size - 1) | (y == self.height - 1)
+
+    def inside(self, x, y):
+        """ Returns True if the spot (x, y) isn't on the edge of its tile. """
+        size = self.tile_size
+        return 0 < x % size < size - 1 and 0 < y % size < size - 1 and \
+            x < self.width - 1 and y < self.height - 1
+
+
+class SharedWorld:
+    """
+    Just enough of a world for a worker's critters to live in: the world's
+    grids and critter table (attached from shared memory by the worker),
+    and the names its critters go by.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.north_of = [(y - 1) % height for y in range(height)]
+        self.south_of = [(y + 1) % height for y in range(height)]
+        self.east_of = [(x + 1) % width for x in range(width)]
+        self.west_of = [(x - 1) % width for x in range(width)]
+        self.critter_id = {} # map critter to its id, for those held here
+        self.type_names = [] # map type id to name, or None if it varies
+        self.critter_names = {} # map critter id to name, for the rest
+        self.np_random = None # the current tile's, for batch policies
+
+    def name_at(self, x, y):
+        """
+        Returns the name of the critter at the given (already wrapped)
+        location, or None if one isn't there.
+        """
+        critter_id = int(self.occupant_grid[y, x])
+        if critter_id == -1:
+            return None
+        name = self.type_names[self.critter_type[critter_id]]
+        if name is None:
+            name = self.critter_names[critter_id]
+        return name
+
+
+class TileWorker:
+    """
+    The part of a ParallelSimulation that runs in a worker process: the
+    critters in some of the world's tiles. Each of its methods is a request
+    the main process can make of it (see ParallelSimulation.call).
+    """
+
+    def __init__(self, width, height, tile_size, rules):
+        self.world = SharedWorld(width, height)
+        self.tiling = Tiling(width, height, tile_size)
+        self.food_coma_period, self.food_comma_sleep_time, \
+            self.gestation_period = rules
+        self.neighbors = Neighbors(self.world)
+        self.critters = {} # map critter id to critter, for those held here
+        self.critter_types = [] # map type id to class
+        self.babies = [] # spawned, waiting to be told their ids
+        self.clock = 0
+        self.rngs = {} # map tile to its random.Random this turn
+        self.planned_attacks = {} # map critter id to attack code
+
+    def hold(self, critter_id, critter):
+        """ Takes charge of the given critter. """
+        self.critters[critter_id] = critter
+        self.world.critter_id[critter] = critter_id
+        critter._world = self.world
+
+    def let_go(self, critter_id):
+        """
+        Stops looking after the critter with the given id, and returns it
+        with its place in the world and move count copied out of the
+        critter table.
+        """
+        world = self.world
+        critter = self.critters.pop(critter_id)
+        del world.critter_id[critter]
+        critter._world = None
+        critter._x = int(world.critter_x[critter_id])
+        critter._y = int(world.critter_y[critter_id])
+        critter._moves_decided = int(world.moves_decided[critter_id])
+        return critter
+
+    def share(self, arrays):
+        """
+        Attaches to the world arrays with the given descriptions (see
+        SharedArray.describe), if any, in place of the old ones.
+        """
+        if not arrays:
+            return
+        for name, description in arrays.items():
+            setattr(self.world, name, _attach(description))
+        _detach_except([description[0] for description in arrays.values()])
+
+    def names_on_edges(self):
+        """
+        Returns the names of the critters held here that are on the edge of
+        a tile, where critters in other workers' tiles can see them, and
+        whose names can change.
+        """
+        world = self.world
+        ids = np.fromiter(self.critters, dtype=np.int64,
+                          count=len(self.critters))
+        varying = np.array([not critter_type.constant_str
+                            for critter_type in self.critter_types] + [False])
+        type_ids = world.critter_type[ids]
+        # (types this worker hasn't been told about yet are left out)
+        type_ids[type_ids >= len(self.critter_types)] = -1
+        shown = varying[type_ids] & \
+            self.tiling.on_edge(world.critter_x[ids], world.critter_y[ids])
+        return {critter_id: str(self.critters[critter_id])
+                for critter_id in ids[shown].tolist()}
+
+    def moved(self, moves):
+        """
+        Tells the critters held here about the moves the main process made
+        for them, a list of (id, x, y), other than those that have died
+        since.
+        """
+        for critter_id, x, y in moves:
+            critter = self.critters.get(critter_id)
+            if critter is not None:
+                critter.move_to(x, y)
+
+    def settle(self, arrays, critter_types, drop, moves, release, spawn):
+        """
+        Forgets the critters with the ids in drop (which have died), tells
+        the rest about their moves (see moved), hands back the ones with the
+        ids in release, and has each (mother id, location) pair in spawn
+        give birth.
+
+        Returns the released (id, critter) pairs, the babies, the names
+        of the critters other workers can see (see names_on_edges) and of
+        the released critters, and the name of each baby (None for those
+        with a constant_str).
+        """
+        self.share(arrays)
+        self.critter_types = critter_types
+        self.drop(drop)
+        self.moved(moves)
+        self.babies = [self.critters[mother_id].spawn(location)
+                       for mother_id, location in spawn]
+        released = [(critter_id, self.let_go(critter_id))
+                    for critter_id in release]
+
+        names = self.names_on_edges()
+        for critter_id, critter in released:
+            if not type(critter).constant_str:
+                names[critter_id] = str(critter)
+        baby_names = [None if type(baby).constant_str else str(baby)
+                      for baby in self.babies]
+        return released, self.babies, names, baby_names
+
+    def decide(self, clock, arrays, critter_types, type_names, adopt,
+               baby_ids, halo, seeds, log):
+        """
+        Does this worker's share of a turn: takes in the (id, critter) pairs
+        in adopt, gives the babies spawned last the ids in baby_ids (-1 for
+        those another worker gets), then runs each tile (see do_tile) using
+        its seed. halo has the names of the critters in other workers'
+        tiles that these critters can see.
+
+        Returns a list of each tile's results, and the current names of the
+        critters whose moves were left to the main process.
+        """
+        self.share(arrays)
+        self.clock = clock
+        self.critter_types = critter_types
+        world = self.world
+        world.type_names = type_names
+        for critter_id, critter in adopt:
+            self.hold(critter_id, critter)
+        for critter_id, baby in zip(baby_ids, self.babies):
+            if critter_id != -1:
+                self.hold(critter_id, baby)
+        self.babies = []
+        self.rngs = {}
+        self.planned_attacks = {}
+
+        # everyone decides from the names critters had at the start of the
+        # turn
+        ids = np.array(sorted(self.critters), dtype=np.int64)
+        varying = np.array([name is None for name in type_names])
+        names = dict(halo)
+        for critter_id in ids[varying[world.critter_type[ids]]].tolist():
+            names[critter_id] = str(self.critters[critter_id])
+        world.critter_names = names
+
+        tiles = self.tiling.tile_of(world.critter_x[ids],
+                                    world.critter_y[ids])
+        order = np.argsort(tiles, kind="stable")
+        ids = ids[order]
+        tiles = tiles[order]
+        starts = np.flatnonzero(np.diff(tiles, prepend=-1))
+        results = []
+        for start, tile_ids in zip(starts.tolist(),
+                                   np.split(ids, starts[1:])):
+            tile = int(tiles[start])
+            results.append(self.do_tile(tile, tile_ids, seeds[tile], log))
+
+        deferred_names = {}
+        for result in results:
+            for critter_id, _, _, _, _ in result[-2]:
+                critter = self.critters.get(critter_id)
+                if critter is not None and not type(critter).constant_str:
+                    deferred_names[critter_id] = str(critter)
+        return results, deferred_names
+
+    def attack(self, critter_id, critter, opponent_name, rng):
+        """
+        Returns the attack the given critter uses against the named
+        opponent: the one its batch policy planned, if it hasn't been used
+        yet, or else the one it picks using rng.
+        """
+        code = self.planned_attacks.pop(critter_id, 0)
+        if code:
+            return attacks_by_code[code]
+        critter.random = rng
+        return critter.fight(opponent_name)
+
+    def name_of(self, critter_id):
+        """ Returns the current name of a critter held here. """
+        name = self.world.type_names[self.world.critter_type[critter_id]]
+        if name is None:
+            name = str(self.critters[critter_id])
+        return name
+
+    def do_tile(self, tile, ids, seed, log):
+        """
+        Has the critters with the given ids, all in the given tile, eat and
+        decide their moves, then makes the moves that stay inside the tile.
+
+        Returns the tile's results: the tile, the ids of the critters that
+        ate, the spots they ate at, the ids of those that fell asleep, the
+        spots critters moved or died on, those of them that were given up
+        and those that were taken, the (mother, father) pairs that
+        started mating, the fights as (attacker, defender, attack code,
+        defense code, whether the attacker won), the moves left for the
+        main process as (id, x, y, id of the critter in the way at the
+        start of the turn or -1, attack code or 0), and the events to log
+        (or None if log is False), in order.
+        """
+        world = self.world
+        clock = self.clock
+        critters = self.critters
+        rng = random.Random(seed)
+        self.rngs[tile] = rng
+        world.np_random = np.random.default_rng(seed)
+        events = [] if log else None
+
+        occupant_grid = world.occupant_grid
+        food_grid = world.food_grid
+        critter_type = world.critter_type
+        critter_x = world.critter_x
+        critter_y = world.critter_y
+        wake_turn = world.wake_turn
+        mating_until = world.mating_until
+        amount_eaten = world.amount_eaten
+        moves_decided = world.moves_decided
+        critter_flags = world.critter_flags
+        width = world.width
+
+        awake = (wake_turn[ids] <= clock) & (mating_until[ids] <= clock)
+
+        # batch policies decide for all of a type's critters in the tile
+        planned_moves = {}
+        type_ids = critter_type[ids]
+        for type_id in np.unique(type_ids).tolist():
+            batch_type = self.critter_types[type_id]
+            if batch_type.fights is not None:
+                batch_ids = ids[type_ids == type_id]
+                batch = Batch(world, [critters[i] for i in batch_ids.tolist()],
+                              batch_ids)
+                self.planned_attacks.update(zip(
+                    batch_ids.tolist(), batch_type.fights(batch).tolist()))
+            if batch_type.get_moves is not None:
+                batch_ids = ids[(type_ids == type_id) & awake]
+                batch = Batch(world, [critters[i] for i in batch_ids.tolist()],
+                              batch_ids)
+                planned_moves.update(zip(
+                    batch_ids.tolist(), batch_type.get_moves(batch).tolist()))
+
+        # everyone eats and decides
+        neighbors = self.neighbors
+        inside = self.tiling.inside
+        ate = []
+        ate_spots = []
+        asleep = []
+        inner_moves = []
+        edge_moves = []
+        for critter_id in ids[awake].tolist():
+            critter = critters[critter_id]
+            critter.random = rng
+            x = int(critter_x[critter_id])
+            y = int(critter_y[critter_id])
+            if food_grid[y, x] and critter.eat():
+                food_grid[y, x] = False
+                amount_eaten[critter_id] += 1
+                ate.append(critter_id)
+                ate_spots.append(y * width + x)
+                if log:
+                    events.append(("ate", critter_id))
+                if amount_eaten[critter_id] % self.food_coma_period == 0:
+                    wake_turn[critter_id] = \
+                        clock + self.food_comma_sleep_time + 1
+                    asleep.append(critter_id)
+                    if log:
+                        events.append(("fell_asleep", critter_id))
+                    continue
+
+            move_code = planned_moves.get(critter_id)
+            if move_code:
+                move = directions_by_code[move_code]
+            else:
+                neighbors.x = x
+                neighbors.y = y
+                move = critter.get_move(neighbors)
+            moves_decided[critter_id] += 1
+
+            if move == Direction.NORTH:
+                dest_x, dest_y = x, world.north_of[y]
+            elif move == Direction.EAST:
+                dest_x, dest_y = world.east_of[x], y
+            elif move == Direction.SOUTH:
+                dest_x, dest_y = x, world.south_of[y]
+            elif move == Direction.WEST:
+                dest_x, dest_y = world.west_of[x], y
+            else:
+                continue
+
+            if inside(x, y) and inside(dest_x, dest_y):
+                inner_moves.append((critter_id, dest_x, dest_y))
+            else:
+                # the attack is picked against whoever is in the way at the
+                # start of the turn, and only used if they still are when
+                # the move is made
+                other_id = int(occupant_grid[dest_y, dest_x])
+                attack_code = 0
+                if other_id != -1 and \
+                        critter_type[other_id] != critter_type[critter_id]:
+                    attack_code = self.attack(
+                        critter_id, critter, world.name_at(dest_x, dest_y),
+                        rng).value
+                edge_moves.append((critter_id, dest_x, dest_y, other_id,
+                                   attack_code))
+
+        # make the moves inside the tile, noting whether each spot they
+        # touch was taken to begin with
+        touched = {}
+        mated = []
+        fought = []
+        for critter_id, dest_x, dest_y in inner_moves:
+            if not critter_flags[critter_id] & alive_flag or \
+                    clock < mating_until[critter_id]:
+                continue
+            x = int(critter_x[critter_id])
+            y = int(critter_y[critter_id])
+            other_id = int(occupant_grid[dest_y, dest_x])
+            if other_id == -1:
+                touched.setdefault(y * width + x, True)
+                touched.setdefault(dest_y * width + dest_x, False)
+                occupant_grid[y, x] = -1
+                occupant_grid[dest_y, dest_x] = critter_id
+                critter_x[critter_id] = dest_x
+                critter_y[critter_id] = dest_y
+                critters[critter_id].move_to(dest_x, dest_y)
+                if log:
+                    events.append(("moved", critter_id, dest_x, dest_y))
+            elif critter_type[other_id] == critter_type[critter_id]:
+                if clock >= mating_until[other_id]:
+                    # mate for the rest of this turn and the next
+                    # gestation_period turns
+                    critter_flags[critter_id] |= pregnant_flag
+                    mating_until[critter_id] = mating_until[other_id] = \
+                        clock + self.gestation_period + 1
+                    mated.append((critter_id, other_id))
+                    if log:
+                        events.append(("mated", critter_id, other_id))
+            else:
+                critter = critters[critter_id]
+                other_critter = critters[other_id]
+                if clock >= wake_turn[other_id]:
+                    attack = self.attack(critter_id, critter,
+                                         self.name_of(other_id), rng)
+                    defense = self.attack(other_id, other_critter,
+                                          self.name_of(critter_id), rng)
+                    winner, _ = battle(critter, other_critter, rng, attack,
+                                       defense)
+                    attack_code = attack.value
+                    defense_code = defense.value
+                else:
+                    # sleeping critters lose automatically
+                    winner = critter
+                    attack_code = defense_code = 0
+                attacker_won = winner is critter
+                loser_id = other_id if attacker_won else critter_id
+                loser_x = int(critter_x[loser_id])
+                loser_y = int(critter_y[loser_id])
+                touched.setdefault(loser_y * width + loser_x, True)
+                occupant_grid[loser_y, loser_x] = -1
+                critter_flags[loser_id] = 0
+                self.let_go(loser_id)
+                fought.append((critter_id, other_id, attack_code,
+                               defense_code, attacker_won))
+                if log:
+                    events.append(("fought", critter_id, other_id,
+                                   attack_code, defense_code, attacker_won))
+
+        spots = np.fromiter(touched, dtype=np.int64, count=len(touched))
+        was_taken = np.fromiter(touched.values(), dtype=bool,
+                                count=len(touched))
+        taken = occupant_grid.ravel()[spots] != -1
+        return (tile, ate, ate_spots, asleep, spots,
+                spots[was_taken & ~taken], spots[taken & ~was_taken], mated,
+                fought, edge_moves, events)
+
+    def defend(self, requests):
+        """
+        Has each critter in requests, a list of (id, opponent name) pairs,
+        pick its attack against the named opponent.
+
+        Returns the attack codes, and the critters' names afterwards.
+        """
+        world = self.world
+        codes = []
+        names = {}
+        for critter_id, opponent_name in requests:
+            critter = self.critters[critter_id]
+            rng = self.rngs[self.tiling.tile_of(
+                int(world.critter_x[critter_id]),
+                int(world.critter_y[critter_id]))]
+            codes.append(self.attack(critter_id, critter, opponent_name,
+                                     rng).value)
+            if not type(critter).constant_str:
+                names[critter_id] = str(critter)
+        return codes, names
+
+    def drop(self, dead_ids):
+        """ Forgets the critters with the given ids, which have died. """
+        for critter_id in dead_ids:
+            if critter_id in self.critters:
+                self.let_go(critter_id)
+
+    def dump(self, dead_ids, moves):
+        """
+        Forgets the critters with the given ids, which have died, tells the
+        rest about their moves (see moved), and returns them by id.
+        """
+        self.drop(dead_ids)
+        self.moved(moves)
+        return self.critters
+
+
+def _serve(connection, width, height, tile_size, rules):
+    """
+    Runs a TileWorker in a worker process, answering requests of (method
+    name, arguments) with (CPU seconds taken, pickled result), or (None,
+    traceback) if the method raised an exception, until asked to "stop".
+    The time taken includes unpickling the request and pickling the result.
+    """
+    worker = TileWorker(width, height, tile_size, rules)
+    while True:
+        # (waiting doesn't take any CPU time)
+        start = time.process_time()
+        method_name, args = connection.recv()
+        if method_name == "stop":
+            break
+        try:
+            result = pickle.dumps(getattr(worker, method_name)(*args),
+                                  pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            connection.send((None, traceback.format_exc()))
+        else:
+            connection.send((time.process_time() - start, result))
+    # the arrays have to go before the shared memory they're in
+    worker.world = None
+    del worker
+    _detach_except(())
+    connection.close()
+
+
+def copy_state(source, critter):
+    """
+    Gives critter whatever its copy source, from a worker process, has
+    remembered. Its place in the world and its move count (which the world
+    keeps) stay as they were.
+    """
+    instance_dict, slots = source.__getstate__()
+    del slots["_x"], slots["_y"], slots["_moves_decided"]
+    for name, value in slots.items():
+        setattr(critter, name, value)
+    if instance_dict:
+        vars(critter).update(instance_dict)
+
+
+class ParallelSimulation(Simulation):
+    """
+    A Simulation that runs its turns in max_workers worker processes (by
+    default, one per core), each of them looking after the critters in a
+    run of tile_size x tile_size tiles of the world. The workers start with
+    the first turn; call close once done with it.
+
+    worker_seconds holds the CPU time each worker spent on the last turn.
+    """
+
+    def __init__(self, world, tile_size=64, max_workers=None):
+        super().__init__(world)
+        self.tiling = Tiling(world.width, world.height, tile_size)
+        self.num_workers = min(max_workers or os.cpu_count() or 1,
+                               self.tiling.num_tiles)
+        # the tiles are handed out in runs, so neighbors mostly share one
+        self.tile_worker = (np.arange(self.tiling.num_tiles) *
+                            self.num_workers // self.tiling.num_tiles)
+        self.workers = None # (process, connection) pairs, once started
+        self.shared = {} # map world array name to its SharedArray
+        self.worker_seconds = [0.0] * self.num_workers
+
+        # per critter id: the worker holding the critter (-1 if none), and
+        # its place in the world's order of critters
+        self.holder = np.zeros(0, dtype=np.int16)
+        self.order = np.zeros(0, dtype=np.int64)
+        self.next_order = 0
+
+        self.names = {} # the latest names of critters whose names change
+        self.to_drop = [[] for _ in range(self.num_workers)] # died, by holder
+        self.moves = [[] for _ in range(self.num_workers)] # made, by holder
+        self.baby_ids = [[] for _ in range(self.num_workers)]
+        self.adopt = [[] for _ in range(self.num_workers)]
+
+    @property
+    def sandbox(self):
+        """ Always None, as critters in the workers can't be sandboxed. """
+        return None
+
+    @sandbox.setter
+    def sandbox(self, sandbox):
+        if sandbox is not None:
+            raise RuntimeError(
+                "Critters in a ParallelSimulation can't be sandboxed.")
+
+    def worker_of(self, x, y):
+        """ Returns the worker looking after the given spots (arrays). """
+        return self.tile_worker[self.tiling.tile_of(x, y)]
+
+    def start_workers(self):
+        """ Starts the worker processes. """
+        world = self.world
+        rules = (world.food_coma_period, world.food_comma_sleep_time,
+                 world.gestation_period)
+        # the workers have to share the main process's resource tracker, or
+        # theirs would free the shared memory when they stop
+        resource_tracker.ensure_running()
+        context = multiprocessing.get_context()
+        self.workers = []
+        for _ in range(self.num_workers):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=_serve, daemon=True,
+                args=(worker_connection, world.width, world.height,
+                      self.tiling.tile_size, rules))
+            process.start()
+            worker_connection.close()
+            self.workers.append((process, connection))
+
+    def call(self, method_name, args):
+        """
+        Calls the given TileWorker method in every worker, with the
+        arguments for each worker in args, and returns their results.
+        """
+        for (_, connection), worker_args in zip(self.workers, args):
+            connection.send((method_name, worker_args))
+        results = []
+        failure = None
+        for i, (_, connection) in enumerate(self.workers):
+            seconds, result = connection.recv()
+            if seconds is None:
+                failure = result
+            else:
+                self.worker_seconds[i] += seconds
+                result = pickle.loads(result)
+            results.append(result)
+        if failure is not None:
+            raise RuntimeError("A worker process failed:\n" + failure)
+        return results
+
+    def share_arrays(self):
+        """
+        Moves the world's arrays into shared memory, if the world has
+        replaced any of them (e.g. when its critter table grows).
+
+        Returns descriptions of all of the shared arrays for the workers if
+        anything moved, or None.
+        """
+        world = self.world
+        moved = False
+        for name in shared_arrays:
+            array = getattr(world, name)
+            shared = self.shared.get(name)
+            if shared is not None and array is shared.array:
+                continue
+            if shared is not None:
+                shared.close()
+            shared = self.shared[name] = SharedArray(array.shape, array.dtype)
+            shared.array[...] = array
+            setattr(world, name, shared.array)
+            moved = True
+        if not moved:
+            return None
+        return {name: shared.describe()
+                for name, shared in self.shared.items()}
+
+    def type_names(self):
+        """
+        Returns the name of each type of critter, by type id, or None for
+        the types whose critters' names can change.
+        """
+        world = self.world
+        names = []
+        for type_id, critter_type in enumerate(world.critter_types):
+            if not critter_type.constant_str:
+                names.append(None)
+                continue
+            if critter_type not in world.type_names and \
+                    world.num_alive[type_id]:
+                # work the name out from any critter of that type
+                for critter in world.critters:
+                    if type(critter) is critter_type:
+                        world.name_of(critter)
+                        break
+            names.append(world.type_names.get(critter_type))
+        return names
+
+    def grow_arrays(self):
+        """ Makes room in holder and order for every id the world has. """
+        capacity = len(self.world.critter_flags)
+        if len(self.holder) < capacity:
+            grown = len(self.holder)
+            self.holder = np.concatenate(
+                [self.holder, np.full(capacity - grown, -1, dtype=np.int16)])
+            self.order = np.concatenate(
+                [self.order, np.full(capacity - grown, -1, dtype=np.int64)])
+
+    def settle(self):
+        """
+        Has the workers spawn this turn's babies and hand over the critters
+        that moved into another worker's tiles, and gives critters new to
+        the world to the workers.
+        """
+        world = self.world
+        num_workers = self.num_workers
+        self.grow_arrays()
+        holder = self.holder
+
+        # critters that came into the world some other way are ordered as
+        # they are in the world, and spawn their babies here
+        num_ids = len(world.critter_by_id)
+        alive = np.flatnonzero(world.critter_flags[:num_ids] & alive_flag)
+        if (self.order[alive] == -1).any():
+            for critter in world.critters:
+                critter_id = world.critter_id[critter]
+                if self.order[critter_id] == -1:
+                    self.order[critter_id] = self.next_order
+                    self.next_order += 1
+
+        spawn = [[] for _ in range(num_workers)]
+        births = []
+        for mother_id in world.advance_gestation().tolist():
+            location = world.get_closest_open_spot(
+                int(world.critter_x[mother_id]),
+                int(world.critter_y[mother_id]))
+            if location is None:
+                continue
+            # keep the spot for the baby (add_critter takes it for good)
+            world.open_spots.remove(location)
+            mother_holder = int(holder[mother_id])
+            if mother_holder != -1:
+                spawn[mother_holder].append((mother_id, location))
+            births.append((mother_holder, mother_id, location))
+
+        # hand over anyone not held by the worker looking after their spot
+        owners = self.worker_of(world.critter_x[alive], world.critter_y[alive])
+        moving = alive[holder[alive] != owners]
+        moving_holders = holder[moving]
+        release = [moving[moving_holders == worker].tolist()
+                   for worker in range(num_workers)]
+
+        arrays = self.share_arrays()
+        results = self.call("settle", [
+            (arrays, world.critter_types, self.to_drop[worker],
+             self.moves[worker], release[worker], spawn[worker])
+            for worker in range(num_workers)])
+        self.to_drop = [[] for _ in range(num_workers)]
+        self.moves = [[] for _ in range(num_workers)]
+
+        adopt = [[] for _ in range(num_workers)]
+        for critter_id in moving[moving_holders == -1].tolist():
+            critter = world.critter_by_id[critter_id]
+            owner = int(self.worker_of(world.critter_x[critter_id],
+                                       world.critter_y[critter_id]))
+            adopt[owner].append((critter_id, critter))
+            holder[critter_id] = owner
+            if not type(critter).constant_str:
+                self.names[critter_id] = str(critter)
+        babies = []
+        for worker, (released, worker_babies, names, baby_names) in \
+                enumerate(results):
+            for critter_id, critter in released:
+                owner = int(self.worker_of(world.critter_x[critter_id],
+                                           world.critter_y[critter_id]))
+                adopt[owner].append((critter_id, critter))
+                holder[critter_id] = owner
+            self.names.update(names)
+            babies.append(list(zip(worker_babies, baby_names)))
+
+        # the babies are born in order of their mothers' ids
+        baby_ids = [[] for _ in range(num_workers)]
+        for mother_holder, mother_id, location in births:
+            if mother_holder == -1:
+                baby = world.critter_by_id[mother_id].spawn(location)
+                name = None if type(baby).constant_str else str(baby)
+            else:
+                baby, name = babies[mother_holder].pop(0)
+            world.add_critter(baby, location)
+            if world.event_log is not None:
+                world.event_log.born(mother_id, *location)
+            self.grow_arrays()
+            holder = self.holder
+            baby_id = world.critter_id[baby]
+            self.order[baby_id] = self.next_order
+            self.next_order += 1
+            if name is not None:
+                self.names[baby_id] = name
+            owner = int(self.worker_of(*location))
+            holder[baby_id] = owner
+            if owner == mother_holder:
+                # the baby stays with the worker that spawned it, sharing
+                # whatever it inherited with its mother
+                baby_ids[mother_holder].append(baby_id)
+            else:
+                if mother_holder != -1:
+                    baby_ids[mother_holder].append(-1)
+                adopt[owner].append((baby_id, baby))
+        self.adopt = adopt
+        self.baby_ids = baby_ids
+
+    def halos(self):
+        """
+        Returns, for each worker, the names of the critters in other
+        workers' tiles that its critters can see and whose names change.
+        """
+        world = self.world
+        ids = np.fromiter(self.names, dtype=np.int64, count=len(self.names))
+        ids = ids[(world.critter_flags[ids] & alive_flag) != 0]
+        x = world.critter_x[ids]
+        y = world.critter_y[ids]
+        seen_by = np.stack([
+            self.worker_of(x, (y - 1) % world.height),
+            self.worker_of((x + 1) % world.width, y),
+            self.worker_of(x, (y + 1) % world.height),
+            self.worker_of((x - 1) % world.width, y)])
+        holders = self.holder[ids]
+        halos = []
+        for worker in range(self.num_workers):
+            shown = ids[(seen_by == worker).any(axis=0) & (holders != worker)]
+            halos.append({critter_id: self.names[critter_id]
+                          for critter_id in shown.tolist()})
+        return halos
+
+    def decide(self, dead_critters, winners):
+        """
+        Has every tile eat, decide and make its inside moves in the workers,
+        then does the bookkeeping for what happened in the main process.
+
+        Returns the moves left to make, in the world's order of critters.
+        """
+        world = self.world
+        event_log = world.event_log
+        type_names = self.type_names()
+        seeds = world.np_random.integers(2**63,
+                                         size=self.tiling.num_tiles).tolist()
+        arrays = self.share_arrays()
+        results = self.call("decide", [
+            (world.clock, arrays, world.critter_types, type_names,
+             self.adopt[worker], self.baby_ids[worker], halo, seeds,
+             event_log is not None)
+            for worker, halo in enumerate(self.halos())])
+        self.adopt = self.baby_ids = None
+
+        tiles = []
+        for worker_tiles, names in results:
+            tiles.extend(worker_tiles)
+            self.names.update(names)
+        tiles.sort(key=lambda result: result[0])
+
+        freed = [result[5] for result in tiles]
+        taken = [result[6] for result in tiles]
+        if tiles:
+            world.open_spots.remove_many(np.concatenate(taken))
+            world.open_spots.add_many(np.concatenate(freed))
+
+        changed_spots = world.changed_spots
+        edge_moves = []
+        for (_, ate, ate_spots, asleep, touched, _, _, mated, fought,
+             tile_edge_moves, events) in tiles:
+            if ate:
+                world.num_eaten += np.bincount(world.critter_type[ate],
+                                               minlength=len(world.num_eaten))
+                world.num_food -= len(ate)
+                if world.food_growth is not None:
+                    for spot in ate_spots:
+                        world.food_growth.eaten(spot)
+            for critter_id in asleep:
+                world.waking.schedule(int(world.wake_turn[critter_id]),
+                                      critter_id)
+            for mother_id, father_id in mated:
+                mating_until = int(world.mating_until[mother_id])
+                world.done_mating.schedule(mating_until, mother_id)
+                world.done_mating.schedule(mating_until, father_id)
+            for attacker_id, defender_id, _, _, attacker_won in fought:
+                if attacker_won:
+                    winner_id, loser_id = attacker_id, defender_id
+                else:
+                    winner_id, loser_id = defender_id, attacker_id
+                winners.append(world.critter_by_id[winner_id])
+                loser = world.critter_by_id[loser_id]
+                world.detach_critter(loser)
+                dead_critters.append(loser)
+            edge_moves.extend(tile_edge_moves)
+
+            if changed_spots is not None:
+                for spot in touched.tolist() + ate_spots:
+                    changed_spots.add((spot % world.width,
+                                       spot // world.width))
+                world._changed_critters(
+                    asleep + [critter_id for pair in mated
+                              for critter_id in pair])
+            if event_log is not None:
+                for event in events:
+                    if event[0] == "fought":
+                        event_log.fought(event[1], event[2],
+                                         attacks_by_code[event[3]],
+                                         attacks_by_code[event[4]], event[5])
+                    else:
+                        getattr(event_log, event[0])(*event[1:])
+
+        edge_moves.sort(key=lambda move: self.order[move[0]])
+        return edge_moves
+
+    def defend(self, edge_moves):
+        """
+        Has the critters that might be run into by the given moves pick
+        their attacks.
+
+        Returns a dictionary mapping (defender id, attacker id) to the
+        defender's attack code.
+        """
+        world = self.world
+        type_names = self.type_names()
+        requests = [[] for _ in range(self.num_workers)]
+        fights = [[] for _ in range(self.num_workers)]
+        for critter_id, dest_x, dest_y, other_id, attack_code in edge_moves:
+            # (a spot inside a tile may have changed hands since the start
+            # of the turn)
+            if not attack_code or \
+                    world.occupant_grid[dest_y, dest_x] != other_id or \
+                    world.clock < world.wake_turn[other_id]:
+                continue
+            name = type_names[world.critter_type[critter_id]]
+            if name is None:
+                name = self.names[critter_id]
+            worker = self.holder[other_id]
+            requests[worker].append((other_id, name))
+            fights[worker].append((other_id, critter_id))
+        if not any(requests):
+            return {}
+
+        defenses = {}
+        for worker_fights, (codes, names) in zip(
+                fights, self.call("defend", [(worker_requests,)
+                                         for worker_requests in requests])):
+            defenses.update(zip(worker_fights, codes))
+            self.names.update(names)
+        return defenses
+
+    def make_edge_moves(self, edge_moves, defenses, dead_critters, winners):
+        """ Makes the given moves (see TileWorker.do_tile), in order. """
+        world = self.world
+        clock = world.clock
+        event_log = world.event_log
+        critter_by_id = world.critter_by_id
+        critter_flags = world.critter_flags
+        critter_type = world.critter_type
+        mating_until = world.mating_until
+        for critter_id, dest_x, dest_y, other_id, attack_code in edge_moves:
+            if not critter_flags[critter_id] & alive_flag or \
+                    clock < mating_until[critter_id]:
+                continue
+            critter = critter_by_id[critter_id]
+            in_the_way = int(world.occupant_grid[dest_y, dest_x])
+            if in_the_way == -1:
+                world.move_critter(critter, dest_x, dest_y)
+                self.moves[self.holder[critter_id]].append(
+                    (critter_id, dest_x, dest_y))
+            elif critter_type[in_the_way] == critter_type[critter_id]:
+                if clock >= mating_until[in_the_way]:
+                    world.mate_critters(critter, critter_by_id[in_the_way])
+            elif in_the_way == other_id and attack_code:
+                other_critter = critter_by_id[other_id]
+                if clock >= world.wake_turn[other_id]:
+                    attack = attacks_by_code[attack_code]
+                    defense = attacks_by_code[defenses[other_id, critter_id]]
+                    winner, loser = battle(critter, other_critter,
+                                           self.coin_flips, attack, defense)
+                else:
+                    # sleeping critters lose automatically
+                    attack = defense = None
+                    winner, loser = critter, other_critter
+                if event_log is not None:
+                    event_log.fought(critter_id, other_id, attack, defense,
+                                     winner is critter)
+                winners.append(winner)
+                dead_critters.append(loser)
+                loser_id = world.critter_id[loser]
+                self.to_drop[self.holder[loser_id]].append(loser_id)
+                world.remove_critter(loser)
+
+    def do_turn(self, notify=True):
+        """
+        Performs a single turn of the simulation in the worker processes,
+        telling the observers about it unless notify is False.
+        """
+        world = self.world
+        world.clock = self.turn_number
+        event_log = world.event_log
+        if self.workers is None:
+            self.start_workers()
+        self.worker_seconds = [0.0] * self.num_workers
+
+        clock = time.perf_counter
+        start = clock()
+        if world.food_growth is not None:
+            world.food_growth.grow(world, self.turn_number)
+        grown = clock()
+        world.rest_critters()
+        rested = clock()
+        self.settle()
+        settled = clock()
+
+        dead_critters = []
+        winners = []
+        edge_moves = self.decide(dead_critters, winners)
+        defenses = self.defend(edge_moves)
+        decided = clock()
+        self.make_edge_moves(edge_moves, defenses, dead_critters, winners)
+        moved = clock()
+
+        world.record_wins(winners)
+        dead_ids = [world.critter_id[critter] for critter in dead_critters]
+        for critter_id in dead_ids:
+            self.names.pop(critter_id, None)
+        self.holder[dead_ids] = -1
+        self.order[dead_ids] = -1
+        world.bury_critters(dead_critters)
+        self.turn_number += 1
+        if self.metrics is not None:
+            done = clock()
+            self.metrics.record_turn(food=grown - start, rest=rested - grown,
+                                     gestate=settled - rested,
+                                     decide=decided - settled,
+                                     combat=moved - decided,
+                                     bury=done - moved, turn=done - start)
+        if event_log is not None:
+            if self.turn_number % event_log.keyframe_every == 0:
+                self.sync()
+            event_log.turn_done(self)
+
+        if notify:
+            self.notify_observers()
+
+    def sync(self):
+        """
+        Brings the critter objects in the main process up to date with
+        their copies in the workers.
+        """
+        if self.workers is None:
+            return
+        critter_by_id = self.world.critter_by_id
+        results = self.call("dump", list(zip(self.to_drop, self.moves)))
+        self.to_drop = [[] for _ in range(self.num_workers)]
+        self.moves = [[] for _ in range(self.num_workers)]
+        for critters in results:
+            for critter_id, copy in critters.items():
+                copy_state(copy, critter_by_id[critter_id])
+
+    def notify_observers(self):
+        if self.observers:
+            self.sync()
+        super().notify_observers()
+
+    def close(self):
+        """
+        Brings the critters up to date, shuts down the worker processes and
+        frees the shared memory.
+        """
+        if self.workers is not None:
+            self.sync()
+            for process, connection in self.workers:
+                connection.send(("stop", ()))
+                process.join()
+                connection.close()
+            self.workers = None
+        # give the world back ordinary arrays
+        for name, shared in self.shared.items():
+            array = getattr(self.world, name)
+            if array is shared.array:
+                setattr(self.world, name, array.copy())
+            del array
+            shared.close()
+        self.shared = {}
+        self.holder[:] = -1
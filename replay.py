@@ -0,0 +1,259 @@
+"""
+Module: replay
+
+Plays back a log written by the eventlog module. A Replay acts just like the
+Simulation that was logged, observers and all, but its turns are redone from
+the log rather than by asking the critters what to do, and it can jump
+straight to any turn of the run.
+
+Examples:
+    python replay.py run.log            # watch the run in the GUI
+    python replay.py run.log --turn 8000
+    python replay.py run.log --stats 1000  # print stats every 1000 turns
+"""
+import argparse
+import io
+import mmap
+
+import numpy as np
+
+import checkpoint
+import eventlog
+from eventlog import records, MOVED, ATE, FELL_ASLEEP, MATED, BORN, \
+    FOUGHT, TURN_DONE, KEYFRAME, INDEX, FOOD_GREW
+from simulation import Simulation
+
+
+class Replay(Simulation):
+    """
+    A Simulation whose turns come from an event log.
+
+    The critters in the log have to be importable, since the keyframes hold
+    the critter objects themselves, but none of their decisions are made
+    again. The only methods of theirs that get called are the constructor
+    (for babies being born), move_to and whatever a display calls.
+    """
+
+    def __init__(self, path):
+        """ Opens the log at the given path, starting at its first turn. """
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_size = len(eventlog.magic) + 4
+        if self.data[:len(eventlog.magic)] != eventlog.magic:
+            raise ValueError("Not a critters event log.")
+        file_version = int.from_bytes(
+            self.data[len(eventlog.magic):header_size], "little")
+        if file_version != eventlog.version:
+            raise ValueError("Unsupported event log version %d." %
+                             file_version)
+
+        self.keyframes, self.last_turn = self.read_index(header_size)
+        if not self.keyframes:
+            raise ValueError("Event log has no keyframes.")
+
+        sim = self.load_keyframe(self.keyframes[0][1])
+        super().__init__(sim.world)
+        self.turn_number = sim.turn_number
+        self.first_turn = sim.turn_number
+
+    def read_index(self, start):
+        """
+        Returns a list of the (turn number, position) of every keyframe in
+        the log and the number of the last turn in it.
+
+        Logs that were closed properly end with an index of this. Otherwise
+        (if the run crashed, say) the whole log is read through to find the
+        keyframes, ignoring anything after the last complete turn.
+        """
+        data = self.data
+        footer = eventlog.footer
+        if len(data) >= start + footer.size:
+            position, index_magic = \
+                footer.unpack_from(data, len(data) - footer.size)
+            if index_magic == eventlog.index_magic:
+                _, num_keyframes, last_turn = \
+                    records[INDEX].unpack_from(data, position)
+                position += records[INDEX].size
+                keyframes = []
+                for _ in range(num_keyframes):
+                    keyframes.append(
+                        eventlog.index_entry.unpack_from(data, position))
+                    position += eventlog.index_entry.size
+                return keyframes, last_turn
+
+        keyframes = []
+        last_turn = None
+        position = start
+        while position < len(data):
+            kind = data[position]
+            record = records[kind]
+            if position + record.size > len(data):
+                break
+            if kind == KEYFRAME:
+                _, turn_number, length = record.unpack_from(data, position)
+                if position + record.size + length > len(data):
+                    break
+                keyframes.append((turn_number, position))
+                if last_turn is None:
+                    last_turn = turn_number
+                position += length
+            elif kind == TURN_DONE:
+                last_turn = record.unpack_from(data, position)[1]
+            position += record.size
+        return keyframes, last_turn
+
+    def load_keyframe(self, position):
+        """
+        Returns the simulation saved in the keyframe at the given position,
+        and leaves the log positioned just after it.
+
+        Its world doesn't grow food by itself, since the food that grew is
+        in the log (and food_growth would only ever be told about food
+        being eaten).
+        """
+        record = records[KEYFRAME]
+        _, turn_number, length = record.unpack_from(self.data, position)
+        start = position + record.size
+        self.position = start + length
+        sim = checkpoint.load(io.BytesIO(self.data[start:self.position]))
+        sim.world.food_growth = None
+        return sim
+
+    def seek(self, turn_number):
+        """
+        Jumps to the given turn (or as close to it as the log goes), starting
+        from the nearest keyframe before it, and tells the observers.
+        """
+        turn_number = max(self.first_turn, min(turn_number, self.last_turn))
+        keyframe_turn, position = \
+            [k for k in self.keyframes if k[0] <= turn_number][-1]
+
+        # no need for the keyframe if we're already between it and the turn
+        if not keyframe_turn <= self.turn_number <= turn_number:
+            sim = self.load_keyframe(position)
+            self.world = sim.world
+            self.turn_number = sim.turn_number
+            self.neighbors = sim.neighbors
+            self.coin_flips = sim.coin_flips
+
+        while self.turn_number < turn_number:
+            self.do_turn(notify=False)
+        self.notify_observers()
+
+    def run(self, num_turns=None, time_limit=None, notify_every=None):
+        """
+        Same as Simulation.run, except that it stops at the end of the log.
+        """
+        turns_left = self.last_turn - self.turn_number
+        if num_turns is None or num_turns > turns_left:
+            num_turns = turns_left
+        if num_turns == 0:
+            return 0
+        return super().run(num_turns, time_limit, notify_every)
+
+    def do_turn(self, notify=True):
+        """
+        Redoes the next turn in the log, telling the observers about it
+        unless notify is False. Does nothing at the end of the log.
+        """
+        if self.turn_number >= self.last_turn:
+            return
+        world = self.world
+        data = self.data
+        position = self.position
+        critter_by_id = world.critter_by_id
+
+        # timers go off just like they did when the turn was first done, but
+        # the births are in the log
+        world.clock = self.turn_number
+        world.rest_critters()
+        world.advance_gestation()
+
+        dead_critters = []
+        winners = []
+        while True:
+            kind = data[position]
+            record = records[kind]
+            fields = record.unpack_from(data, position)
+            position += record.size
+
+            if kind == MOVED:
+                _, critter_id, x, y = fields
+                world.move_critter(critter_by_id[critter_id], x, y)
+            elif kind == ATE:
+                critter = critter_by_id[fields[1]]
+                world.feed_critter(critter, *world.get_location(critter))
+            elif kind == FELL_ASLEEP:
+                # feed_critter has already put the critter to sleep
+                pass
+            elif kind == MATED:
+                world.mate_critters(critter_by_id[fields[1]],
+                                    critter_by_id[fields[2]])
+            elif kind == BORN:
+                _, mother_id, x, y = fields
+                world.add_critter(critter_by_id[mother_id].spawn((x, y)),
+                                  (x, y))
+            elif kind == FOUGHT:
+                _, attacker_id, defender_id, _, _, attacker_won = fields
+                attacker = critter_by_id[attacker_id]
+                defender = critter_by_id[defender_id]
+                if attacker_won:
+                    winner, loser = attacker, defender
+                else:
+                    winner, loser = defender, attacker
+                winners.append(winner)
+                dead_critters.append(loser)
+                world.remove_critter(loser)
+            elif kind == FOOD_GREW:
+                _, x, y = fields
+                world.add_food(np.array([y * world.width + x]))
+            elif kind == KEYFRAME:
+                position += fields[2]
+            elif kind == TURN_DONE:
+                turn_number = fields[1]
+                break
+
+        world.record_wins(winners)
+        world.bury_critters(dead_critters)
+
+        self.turn_number = turn_number
+        self.position = position
+        if self.metrics is not None:
+            self.metrics.record_turn()
+
+        if notify:
+            self.notify_observers()
+
+
+def print_stats(sim):
+    """ Replay observer that prints each critter type's stats. """
+    world = sim.world
+    print("Turn %d" % sim.turn_number)
+    for critter_type in world.critter_types:
+        alive, kills, eaten = world.get_stats(critter_type)
+        print("  %-12s alive %6d  kills %6d  eaten %6d" %
+              (critter_type.__name__, alive, kills, eaten))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("log", help="event log to play back")
+    parser.add_argument("--turn", type=int, default=0,
+                        help="turn to start at")
+    parser.add_argument("--stats", type=int, metavar="N",
+                        help="don't show the GUI, just print stats every N "
+                             "turns")
+    args = parser.parse_args(args)
+
+    if args.stats:
+        replay = Replay(args.log)
+        replay.add_observer(print_stats)
+        replay.seek(args.turn)
+        replay.run(notify_every=args.stats)
+    else:
+        from gui import play_back
+        play_back(args.log, args.turn)
+
+
+if __name__ == "__main__":
+    main()
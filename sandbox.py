@@ -0,0 +1,225 @@
+"""
+Module: sandbox
+
+Keeps critters from holding up a simulation. Every call into a critter's
+code (get_move, fight, eat, and the batch policies get_moves and fights) is
+timed, and what it cost is added up per critter class, so a slow strategy
+is easy to find.
+
+Each call has a time budget. A call that goes over it still counts, but its
+answer is thrown away and the critter is charged the default instead:
+Direction.CENTER for moves, Attack.FORFEIT for fights and False for eating.
+A call that runs on far past its budget (e.g. stuck in an infinite loop) is
+interrupted once it reaches hard_limit seconds, and one that raises an
+exception or answers with something other than a Direction or Attack is
+treated the same way. Interrupting needs SIGALRM, so it only
+happens on Unix and when the simulation runs in the main thread.
+
+Example:
+    sandbox = Sandbox(sim, budget=0.001)
+    sim.run(1000)
+    sandbox.print_report()
+"""
+import signal
+import threading
+import time
+
+import numpy as np
+
+from simulation import Direction, Attack
+
+
+class Timeout(BaseException):
+    """
+    Raised inside a critter's code when it runs past the hard limit. It isn't
+    an Exception, so critter code that catches every Exception can't swallow
+    it and keep running.
+    """
+
+
+def _interrupt(signum, frame):
+    raise Timeout()
+
+
+def _anything(result):
+    return True
+
+
+def _is_direction(result):
+    return isinstance(result, Direction)
+
+
+def _is_attack(result):
+    return isinstance(result, Attack)
+
+
+class Cost:
+    """ What the calls to one method of one critter class have cost. """
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.max_seconds = 0.0
+        self.over_budget = 0 # calls whose answer was thrown away for time
+        self.timeouts = 0 # calls interrupted at the hard limit
+        self.errors = 0 # calls that raised an exception
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class Sandbox:
+    """
+    Runs the critter code of the given simulation with time limits: budget
+    seconds per call, and hard_limit seconds (None for no limit) before a
+    call is interrupted.
+    """
+
+    def __init__(self, sim, budget=0.01, hard_limit=1.0):
+        # (done first, in case the simulation can't be sandboxed)
+        sim.sandbox = self
+        self.sim = sim
+        self.budget = budget
+        self.costs = {} # map (critter class, method name) to its Cost
+
+        # only the main thread gets signals
+        self.hard_limit = hard_limit
+        if not hasattr(signal, "setitimer") or \
+                threading.current_thread() is not threading.main_thread():
+            self.hard_limit = None
+        if self.hard_limit is not None:
+            self.old_handler = signal.signal(signal.SIGALRM, _interrupt)
+
+    def call(self, critter_type, method_name, default, check, function,
+             *args):
+        """
+        Calls function with the given arguments as critter_type's method
+        method_name, returning default rather than its answer if it takes
+        too long, fails, or gives an answer that check returns False for.
+        """
+        cost = self.costs.get((critter_type, method_name))
+        if cost is None:
+            cost = self.costs[critter_type, method_name] = Cost()
+
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        if self.hard_limit is not None:
+            signal.setitimer(signal.ITIMER_REAL, self.hard_limit)
+        failed = True
+        try:
+            # the timer is stopped inside the try, since it can still go off
+            # after the function returns and before it's stopped
+            try:
+                result = function(*args)
+                failed = False
+            finally:
+                if self.hard_limit is not None:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+        except Timeout:
+            failed = True
+            cost.timeouts += 1
+        except Exception:
+            cost.errors += 1
+        seconds = time.perf_counter() - start
+
+        cost.calls += 1
+        cost.seconds += seconds
+        cost.cpu_seconds += time.process_time() - cpu_start
+        if seconds > cost.max_seconds:
+            cost.max_seconds = seconds
+        if failed:
+            return default
+        if seconds > self.budget:
+            cost.over_budget += 1
+            return default
+        if not check(result):
+            cost.errors += 1
+            return default
+        return result
+
+    def get_move(self, critter, neighbors):
+        return self.call(type(critter), "get_move", Direction.CENTER,
+                         _is_direction, critter.get_move, neighbors)
+
+    def fight(self, critter, opponent):
+        return self.call(type(critter), "fight", Attack.FORFEIT,
+                         _is_attack, critter.fight, opponent)
+
+    def eat(self, critter):
+        return self.call(type(critter), "eat", False, _anything,
+                         critter.eat)
+
+    def get_moves(self, critter_type, batch):
+        """
+        Calls a batch policy's get_moves, with a budget of budget seconds
+        per critter in the batch.
+        """
+        return self.batch(critter_type, "get_moves", Direction.CENTER, batch)
+
+    def fights(self, critter_type, batch):
+        """
+        Calls a batch policy's fights, with a budget of budget seconds per
+        critter in the batch.
+        """
+        return self.batch(critter_type, "fights", Attack.FORFEIT, batch)
+
+    def batch(self, critter_type, method_name, default, batch):
+        """
+        Calls a batch policy, defaulting every critter in the batch unless it
+        gives a valid code (see Critter.get_moves) for each of them.
+        """
+        num_critters = len(batch.ids)
+        default_codes = np.full(num_critters, default.value, dtype=np.int8)
+        num_codes = len(type(default))
+
+        def check(codes):
+            codes = np.asarray(codes)
+            return codes.shape == (num_critters,) and \
+                np.issubdtype(codes.dtype, np.integer) and \
+                bool(((codes >= 1) & (codes <= num_codes)).all())
+
+        budget = self.budget
+        self.budget = budget * max(1, num_critters)
+        try:
+            return self.call(critter_type, method_name, default_codes, check,
+                             getattr(critter_type, method_name), batch)
+        finally:
+            self.budget = budget
+
+    def report(self):
+        """
+        Returns a dictionary mapping the name of each critter class to a
+        dictionary mapping the name of each of its methods that was called
+        to a dictionary of what the calls cost (see Cost).
+        """
+        report = {}
+        for (critter_type, method_name), cost in self.costs.items():
+            report.setdefault(critter_type.__name__, {})[method_name] = \
+                cost.as_dict()
+        return report
+
+    def print_report(self):
+        """ Prints what each critter class has cost, the most costly first. """
+        totals = {}
+        for (critter_type, _), cost in self.costs.items():
+            totals[critter_type] = totals.get(critter_type, 0) + cost.seconds
+        print("%-12s %-10s %9s %10s %10s %8s %8s %6s" %
+              ("critter", "method", "calls", "seconds", "max ms",
+               "over", "timeouts", "errors"))
+        for critter_type in sorted(totals, key=totals.get, reverse=True):
+            for (other_type, method_name), cost in self.costs.items():
+                if other_type is not critter_type:
+                    continue
+                print("%-12s %-10s %9d %10.3f %10.3f %8d %8d %6d" %
+                      (critter_type.__name__, method_name, cost.calls,
+                       cost.seconds, 1000 * cost.max_seconds,
+                       cost.over_budget, cost.timeouts, cost.errors))
+
+    def close(self):
+        """ Stops sandboxing the simulation's critters. """
+        if self.sim.sandbox is self:
+            self.sim.sandbox = None
+        if self.hard_limit is not None:
+            signal.signal(signal.SIGALRM, self.old_handler)
+            self.hard_limit = None
@@ -0,0 +1,1585 @@
+"""
+Module: simulation
+
+The headless Critters engine. Nothing in here knows about tkinter, so worlds
+can be simulated on machines without a display; the GUI (see the gui module)
+is just an observer that gets told about each finished turn.
+"""
+import heapq
+import math
+import random
+import time
+from enum import Enum
+from collections.abc import Mapping
+
+import numpy as np
+
+food_coma_period = 2 # how many times critter can eat before falling asleep
+food_comma_sleep_time = 20  # how long a critter sleeps after eating too much
+gestation_period = 40 # how long the mating period is for critters
+
+# bits of a critter's flags in the world's critter table (see World)
+alive_flag = 1 # in the world (not removed, even if it isn't buried yet)
+pregnant_flag = 2
+
+
+class Direction(Enum):
+    NORTH = 1
+    EAST = 2
+    SOUTH = 3
+    WEST = 4
+    CENTER = 5
+
+class Attack(Enum):
+    ROAR = 1
+    POUNCE = 2
+    SCRATCH = 3
+    FORFEIT = 4
+
+# batch policies (see Critter.get_moves) give directions and attacks as codes,
+# their enum values, which these tuples turn back into the enums
+directions_by_code = (None,) + tuple(Direction)
+attacks_by_code = (None,) + tuple(Attack)
+
+
+def _beats(attack1, attack2):
+    """ Returns True if attack1 wins against a different attack2. """
+    return attack2 == Attack.FORFEIT \
+        or attack1 == Attack.ROAR and attack2 == Attack.SCRATCH \
+        or attack1 == Attack.SCRATCH and attack2 == Attack.POUNCE \
+        or attack1 == Attack.POUNCE and attack2 == Attack.ROAR
+
+# outcome_table[a][b] is 1 if attack code a beats attack code b, -1 if it
+# loses and 0 if it's a tie (row and column 0 aren't used)
+outcome_table = np.zeros((5, 5), dtype=np.int8)
+for _attack1 in Attack:
+    for _attack2 in Attack:
+        if _attack1 != _attack2:
+            outcome_table[_attack1.value, _attack2.value] = \
+                1 if _beats(_attack1, _attack2) else -1
+_outcome_rows = outcome_table.tolist()
+
+
+class Critter:
+    # Critters keep their attributes in slots rather than a __dict__, since
+    # worlds can hold millions of them. Subclasses that don't declare
+    # __slots__ of their own get a __dict__ as usual.
+    #
+    # While a critter is in a world, its location and the number of moves
+    # it has decided on live in the world's critter table (see World) and
+    # x, y and moves_decided read them from there; _x, _y and
+    # _moves_decided only hold them while the critter is outside of a world. Setting x or y only moves a critter
+    # that is outside of a world: worlds move their critters themselves
+    # (see World.move_critter).
+    __slots__ = ("_world", "_x", "_y", "_moves_decided", "_random")
+
+    # Names of the attributes a baby gets from its mother when it is born (see
+    # spawn). Everything else is set up fresh by the baby's constructor.
+    inherited_fields = ()
+
+    # Set this to True if str() always gives the same string for every
+    # critter of this type, so the world only has to work it out once.
+    constant_str = False
+
+    # A critter type can decide for all of its critters at once by defining
+    # these as classmethods taking a Batch and returning a NumPy array with
+    # a Direction (for get_moves) or Attack (for fights) value per critter in
+    # the batch. Types without them have each critter decide by itself.
+    #
+    # get_moves is called once a turn, before anyone moves, with all of the
+    # type's critters that are awake and not mating; each critter then makes
+    # its move when its turn comes, unless it falls asleep, starts mating or
+    # dies first. fights is called once a turn with all of the type's
+    # critters, and gives the attack each one uses in its first fight of the
+    # turn, so it can't depend on who the opponent is (any later fights in
+    # the same turn call fight as usual).
+    get_moves = None
+    fights = None
+
+    def __new__(cls, *args, **kwargs):
+        critter = super().__new__(cls)
+        # (set here rather than in __init__, so that subclasses that don't
+        # call Critter.__init__ still start out outside of any world)
+        critter._world = None
+        critter._moves_decided = 0
+        return critter
+
+    def __init__(self, location):
+        self._x = location[0]
+        self._y = location[1]
+
+    @property
+    def x(self):
+        world = self._world
+        if world is None:
+            return self._x
+        return int(world.critter_x[world.critter_id[self]])
+
+    @x.setter
+    def x(self, x):
+        self._x = x
+
+    @property
+    def y(self):
+        world = self._world
+        if world is None:
+            return self._y
+        return int(world.critter_y[world.critter_id[self]])
+
+    @y.setter
+    def y(self, y):
+        self._y = y
+
+    @property
+    def moves_decided(self):
+        """
+        How many moves this critter has decided on. The world counts them,
+        one for each call to get_move and each move a batch policy plans
+        that the critter goes on to make, so critters can read it but not
+        change it.
+        """
+        world = self._world
+        if world is None:
+            return self._moves_decided
+        return int(world.moves_decided[world.critter_id[self]])
+
+    @property
+    def random(self):
+        """
+        The random number generator critters should use for any randomness
+        they need. A world gives each of its critters its own seeded
+        generator, so that runs can be repeated; the random module is only
+        used outside of a world.
+        """
+        try:
+            return self._random
+        except AttributeError:
+            return random
+
+    @random.setter
+    def random(self, rng):
+        self._random = rng
+
+    def __getstate__(self):
+        """
+        Returns the critter's attributes for pickling (see the checkpoint
+        module), leaving out its world and random number generator but
+        keeping its location and the number of moves it has decided on.
+        """
+        # (object only gained a __getstate__ that handles slots in Python
+        # 3.11, so the slots are gathered here)
+        slots = {}
+        for cls in type(self).__mro__:
+            names = cls.__dict__.get("__slots__", ())
+            if isinstance(names, str):
+                names = (names,)
+            for name in names:
+                if name in ("__dict__", "__weakref__"):
+                    continue
+                if name.startswith("__") and not name.endswith("__"):
+                    name = "_%s%s" % (cls.__name__.lstrip("_"), name)
+                try:
+                    slots[name] = getattr(self, name)
+                except AttributeError:
+                    pass
+        instance_dict = getattr(self, "__dict__", None)
+        slots.pop("_world", None)
+        slots.pop("_random", None)
+        slots["_x"] = self.x
+        slots["_y"] = self.y
+        slots["_moves_decided"] = self.moves_decided
+        return instance_dict, slots
+
+    def __setstate__(self, state):
+        instance_dict, slots = state
+        if instance_dict:
+            vars(self).update(instance_dict)
+        for name, value in slots.items():
+            setattr(self, name, value)
+        self._world = None
+
+    def __str__(self):
+        """
+        Returns a string representation of this critter.
+        This representation is used when fighting another critter.
+        """
+        return "?"
+
+    def get_move(self, neighbors):
+        """ Gets the next move the critter wants to make. """
+        return Direction.CENTER
+
+    def fight(self, opponent):
+        """ Gets the next fight move for the critter. """
+        return Attack.FORFEIT
+
+    def eat(self):
+        """ Returns True if the critter wants to eat, False otherwise. """
+        return False
+
+    def get_color(self):
+        return "Blue"
+
+    def move_to(self, x, y):
+        """
+        Changes the location of this Critter. Worlds call this whenever they
+        move one of their critters (see World.move_critter).
+        """
+        self.x = x
+        self.y = y
+
+    def spawn(self, location):
+        """
+        Returns a new baby of this critter, at the given location.
+
+        The baby is made by calling the constructor with just the location,
+        then given the same values as its mother for the attributes named in
+        inherited_fields (not copies of them, so mutable values like lists
+        are shared). Override this to control exactly what babies inherit.
+        """
+        baby = type(self)(location)
+        for field in self.inherited_fields:
+            setattr(baby, field, getattr(self, field))
+        return baby
+
+
+class OpenSpots:
+    """
+    The set of open spots in a world, stored so that adding a spot, removing
+    a spot and picking a random spot all take constant time.
+
+    Each spot is numbered y * width + x. The numbers of the open spots are
+    kept (in no particular order) in the first count entries of the cells
+    array, and index maps a spot's number to where it is in cells, or -1 if
+    the spot isn't open. Removing a spot moves the last open spot into the
+    hole it leaves behind. Both arrays have room for every spot of the world
+    from the start, at 4 bytes a spot.
+
+    The world is also divided into block_size x block_size blocks, with
+    block_open counting the open spots in each block, so that searching for
+    the closest open spot can skip over blocks that are completely full.
+    """
+
+    block_size = 8
+
+    def __init__(self, width, height, rng):
+        """
+        Creates a set where every spot of a width x height world is open,
+        picking random spots using the given random.Random.
+        """
+        self.width = width
+        self.height = height
+        self.random = rng
+        self.cells = np.arange(width * height, dtype=np.int32)
+        self.index = np.arange(width * height, dtype=np.int32)
+        self.count = width * height
+
+        size = self.block_size
+        self.blocks_wide = (width + size - 1) // size
+        self.blocks_high = (height + size - 1) // size
+        block_x = np.arange(self.blocks_wide)
+        block_y = np.arange(self.blocks_high)[:, None]
+        self.block_open = (np.minimum(size, height - block_y * size) *
+                           np.minimum(size, width - block_x * size)
+                           ).astype(np.int32).ravel()
+        self._views()
+
+    def _views(self):
+        # the spots are added, removed and searched one at a time, and
+        # memoryviews get and set single entries of the arrays several times
+        # faster than indexing the arrays themselves does
+        self._cells = memoryview(self.cells)
+        self._index = memoryview(self.index)
+        self._block_open = memoryview(self.block_open)
+
+    def reset(self, cells):
+        """
+        Makes the set hold exactly the given spot numbers, in the given
+        order, reusing its arrays.
+        """
+        cells = np.asarray(cells, dtype=np.int32)
+        self.count = len(cells)
+        self.cells[:self.count] = cells
+        self.index.fill(-1)
+        self.index[cells] = np.arange(self.count, dtype=np.int32)
+
+        self.block_open[:] = np.bincount(
+            self._blocks(cells), minlength=self.blocks_wide * self.blocks_high)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, location):
+        return self._index[location[1] * self.width + location[0]] != -1
+
+    def _block(self, x, y):
+        """ Returns the number of the block containing the given location. """
+        return (y // self.block_size) * self.blocks_wide + x // self.block_size
+
+    def add(self, location):
+        """ Marks the given location as open. """
+        cell = location[1] * self.width + location[0]
+        index = self._index
+        if index[cell] == -1:
+            index[cell] = self.count
+            self._cells[self.count] = cell
+            self.count += 1
+            self._block_open[self._block(location[0], location[1])] += 1
+
+    def remove(self, location):
+        """ Marks the given location as taken. """
+        cell = location[1] * self.width + location[0]
+        index = self._index
+        i = index[cell]
+        if i != -1:
+            cells = self._cells
+            self.count -= 1
+            last = cells[self.count]
+            if last != cell:
+                cells[i] = last
+                index[last] = i
+            index[cell] = -1
+            self._block_open[self._block(location[0], location[1])] -= 1
+
+    def add_many(self, cells):
+        """
+        Marks the spots with the given numbers, none of which are open, as
+        open, in the given order.
+        """
+        cells = np.asarray(cells, dtype=np.int32)
+        end = self.count + len(cells)
+        self.cells[self.count:end] = cells
+        self.index[cells] = np.arange(self.count, end, dtype=np.int32)
+        self.count = end
+        np.add.at(self.block_open, self._blocks(cells), 1)
+
+    def remove_many(self, cells):
+        """
+        Marks the spots with the given numbers, all of them open and none
+        given twice, as taken.
+        """
+        cells = np.asarray(cells, dtype=np.int32)
+        end = self.count - len(cells)
+        positions = self.index[cells]
+        self.index[cells] = -1
+        # the open spots left past the new end fill the holes before it, in
+        # order, the same way every time
+        holes = np.sort(positions[positions < end])
+        tail = self.cells[end:self.count]
+        tail = tail[self.index[tail] != -1]
+        self.cells[holes] = tail
+        self.index[tail] = holes
+        self.count = end
+        np.subtract.at(self.block_open, self._blocks(cells), 1)
+
+    def _blocks(self, cells):
+        """ Returns the numbers of the blocks the given spots are in. """
+        size = self.block_size
+        return (cells // self.width // size) * self.blocks_wide + \
+            (cells % self.width) // size
+
+    def choice(self):
+        """ Returns a random open location, or None if there aren't any. """
+        if not self.count:
+            return None
+        cell = self._cells[self.random.randrange(self.count)]
+        return cell % self.width, cell // self.width
+
+    def closest(self, x, y):
+        """
+        Returns the open location that takes the fewest steps to reach from
+        (x, y), wrapping around the edges of the world, or None if there
+        aren't any open locations.
+        """
+        if not self.count:
+            return None
+
+        # Unless the world is very crowded, an open spot turns up within a
+        # few steps, so first check each ring of spots r steps away.
+        width, height, index = self.width, self.height, self._index
+        for r in range(self.block_size):
+            for dx in range(-r, r + 1):
+                spot_x = (x + dx) % width
+                dy = r - abs(dx)
+                spot_y = (y + dy) % height
+                if index[spot_y * width + spot_x] != -1:
+                    return spot_x, spot_y
+                spot_y = (y - dy) % height
+                if index[spot_y * width + spot_x] != -1:
+                    return spot_x, spot_y
+
+        # Everything nearby is taken, so search outwards block by block,
+        # closest block first, only looking at the spots of blocks that have
+        # an open spot. We can stop once the closest unsearched block can't
+        # possibly beat the best spot found so far.
+        size = self.block_size
+        start = self._block(x, y)
+        to_search = [(0, start)]
+        seen = {start}
+        best = None
+        best_steps = width + height
+        while to_search:
+            steps, block = heapq.heappop(to_search)
+            if steps >= best_steps:
+                break
+
+            block_x = block % self.blocks_wide
+            block_y = block // self.blocks_wide
+            if self._block_open[block] > 0:
+                for spot_y in range(block_y * size,
+                                    min(height, block_y * size + size)):
+                    for spot_x in range(block_x * size,
+                                        min(width, block_x * size + size)):
+                        if index[spot_y * width + spot_x] == -1:
+                            continue
+                        spot_steps = _wrapped_gap(x, spot_x, spot_x, width) + \
+                            _wrapped_gap(y, spot_y, spot_y, height)
+                        if spot_steps < best_steps:
+                            best = spot_x, spot_y
+                            best_steps = spot_steps
+
+            for next_x, next_y in ((block_x, block_y - 1),
+                                   (block_x + 1, block_y),
+                                   (block_x, block_y + 1),
+                                   (block_x - 1, block_y)):
+                next_x %= self.blocks_wide
+                next_y %= self.blocks_high
+                next_block = next_y * self.blocks_wide + next_x
+                if next_block not in seen:
+                    seen.add(next_block)
+                    next_steps = \
+                        _wrapped_gap(x, next_x * size,
+                                     min(width, next_x * size + size) - 1,
+                                     width) + \
+                        _wrapped_gap(y, next_y * size,
+                                     min(height, next_y * size + size) - 1,
+                                     height)
+                    heapq.heappush(to_search, (next_steps, next_block))
+
+        return best
+
+
+class FoodGrowth:
+    """
+    Makes food grow back in a world over time. Give a world one by setting
+    its food_growth; without one, eaten food is gone for good.
+
+    Food can come back in three ways, each of them optional:
+        - regrow_delay turns after being eaten, food grows back in the same
+          spot (each eaten spot is put on a wheel of timers keyed by the
+          turn it regrows on, so only the spots due each turn are touched)
+        - each spot has a spawn_rate chance per turn of food appearing
+        - each spot with food has a spread_rate chance per turn of spreading
+          to a random one of its four neighbors
+    The spawning and spreading rates go up and down with the seasons, by up
+    to season_amplitude times themselves over a cycle of season_length turns
+    (with an amplitude over 1, nothing grows in the depths of winter).
+
+    Spawning and spreading don't look at every spot every turn. Instead,
+    the number of spots to try is drawn from the binomial distribution it
+    would follow, and just that many random spots are tried, so a turn costs
+    time in proportion to how much food grows rather than to the size of the
+    world.
+    """
+
+    # how far north, east, south and west are in x and y
+    spread_x = np.array([0, 1, 0, -1])
+    spread_y = np.array([-1, 0, 1, 0])
+
+    def __init__(self, regrow_delay=None, spawn_rate=0.0, spread_rate=0.0,
+                 season_length=None, season_amplitude=0.0):
+        # food eaten this turn can't regrow on the turn already under way
+        if regrow_delay is not None and regrow_delay < 1:
+            raise ValueError("regrow_delay must be at least 1 turn.")
+        self.regrow_delay = regrow_delay
+        self.spawn_rate = spawn_rate
+        self.spread_rate = spread_rate
+        self.season_length = season_length
+        self.season_amplitude = season_amplitude
+
+        self.turn_number = 0 # the turn food last grew on
+        self.regrowing = TimerWheel() # spots waiting to regrow
+
+    def clear(self):
+        """ Forgets about all of the food waiting to regrow. """
+        self.regrowing = TimerWheel()
+
+    def season(self, turn_number):
+        """
+        Returns how much the spawning and spreading rates are multiplied by
+        on the given turn.
+        """
+        if not self.season_length:
+            return 1.0
+        return 1.0 + self.season_amplitude * \
+            math.sin(2 * math.pi * turn_number / self.season_length)
+
+    def eaten(self, spot):
+        """ Schedules the food at the given spot number to regrow. """
+        if self.regrow_delay is not None:
+            self.regrowing.schedule(self.turn_number + self.regrow_delay,
+                                    spot)
+
+    def grow(self, world, turn_number):
+        """ Grows the food due to grow in the given world this turn. """
+        self.turn_number = turn_number
+        regrowing = self.regrowing.pop(turn_number)
+        if regrowing:
+            world.add_food(np.array(regrowing))
+
+        season = max(0.0, self.season(turn_number))
+        num_spots = world.width * world.height
+        np_random = world.np_random
+        if self.spawn_rate:
+            count = np_random.binomial(num_spots,
+                                       min(1.0, self.spawn_rate * season))
+            if count:
+                world.add_food(np_random.integers(num_spots, size=count))
+        if self.spread_rate:
+            count = np_random.binomial(num_spots,
+                                       min(1.0, self.spread_rate * season))
+            if count:
+                spots = np_random.integers(num_spots, size=count)
+                spots = spots[world.food_grid.ravel()[spots]]
+                x = spots % world.width
+                y = spots // world.width
+                direction = np_random.integers(4, size=len(spots))
+                x += self.spread_x[direction]
+                y += self.spread_y[direction]
+                world.add_food(y % world.height * world.width +
+                               x % world.width)
+
+
+class TimerWheel:
+    """
+    Timers that go off on a given turn, e.g. critters waking up. The timers
+    are kept in lists hashed by the absolute turn they go off on, so setting
+    a timer and collecting the ones going off on a turn take constant time
+    per timer, however many timers are waiting.
+    """
+
+    def __init__(self):
+        self.slots = {} # map from turn to the list of things due then
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.slots.values())
+
+    def schedule(self, turn_number, item):
+        """ Sets a timer for item to go off on the given turn. """
+        slot = self.slots.get(turn_number)
+        if slot is None:
+            self.slots[turn_number] = [item]
+        else:
+            slot.append(item)
+
+    def pop(self, turn_number):
+        """
+        Returns the list of items whose timers go off on the given turn,
+        forgetting about them.
+        """
+        return self.slots.pop(turn_number, [])
+
+
+def _wrapped_gap(v, low, high, size):
+    """
+    Returns how many steps it takes to get from v to the closest value in
+    low..high, on an axis of the given size that wraps around.
+    """
+    if low <= v <= high:
+        return 0
+    return min((low - v) % size, (v - high) % size)
+
+
+class Batch:
+    """
+    A group of critters of the same type deciding what to do together (see
+    Critter.get_moves).
+
+    critters is the list of critters, ids a NumPy array of their ids in the
+    world, and random the world's NumPy random number Generator. The list of
+    critters (if not given) and the x and y arrays of their locations are
+    only worked out if asked for.
+    """
+
+    def __init__(self, world, critters, ids):
+        self.world = world
+        self._critters = critters
+        self.ids = ids
+        self.random = world.np_random
+        self._x = None
+        self._y = None
+
+    @property
+    def critters(self):
+        if self._critters is None:
+            critter_by_id = self.world.critter_by_id
+            self._critters = [critter_by_id[i] for i in self.ids.tolist()]
+        return self._critters
+
+    @property
+    def x(self):
+        if self._x is None:
+            self._x = self.world.critter_x[self.ids]
+        return self._x
+
+    @property
+    def y(self):
+        if self._y is None:
+            self._y = self.world.critter_y[self.ids]
+        return self._y
+
+
+class Neighbors(Mapping):
+    """
+    A read-only view of who is next to a spot in a world, mapping each of
+    Direction.NORTH, EAST, SOUTH and WEST to the name of the critter in that
+    direction, or None if there isn't one.
+
+    The simulation reuses one view for every critter, moving it to each
+    critter's spot in turn, and only looks up the neighbors a critter
+    actually asks about. A critter that wants to remember its neighbors for
+    later has to copy them, e.g. with dict(neighbors).
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.x = 0
+        self.y = 0
+
+    def __getitem__(self, direction):
+        world = self.world
+        if direction is Direction.NORTH:
+            return world.name_at(self.x, world.north_of[self.y])
+        elif direction is Direction.EAST:
+            return world.name_at(world.east_of[self.x], self.y)
+        elif direction is Direction.SOUTH:
+            return world.name_at(self.x, world.south_of[self.y])
+        elif direction is Direction.WEST:
+            return world.name_at(world.west_of[self.x], self.y)
+        raise KeyError(direction)
+
+    def __iter__(self):
+        return iter((Direction.NORTH, Direction.EAST, Direction.SOUTH,
+                     Direction.WEST))
+
+    def __len__(self):
+        return 4
+
+
+# the names of the World arrays that make up its critter table
+critter_table = ("critter_type", "critter_x", "critter_y", "wake_turn",
+                 "mating_until", "amount_eaten", "moves_decided",
+                 "critter_flags")
+
+
+class World:
+    """
+    Representation of a 2D grid world containing critters.
+
+    The state of the world is kept in NumPy arrays rather than Python
+    objects. food_grid and occupant_grid are height x width arrays saying
+    whether each spot has food and the id of the critter there (-1 if there
+    isn't one). Every critter in the world is given a small integer id, and
+    the world keeps a table of its critters as arrays indexed by that id:
+    their type ids, locations, timers, eating and move counts and flags (see
+    alive_flag). The table is the only place a critter's location is kept.
+    Likewise each critter class is given a type id when it is registered (see
+    register_type), and each type's stats are kept in arrays indexed by it.
+
+    Once watch_changes has been called, the world also remembers which spots
+    have changed in any way (critters moving, dying, being born, eating,
+    falling asleep, waking up, or starting or stopping mating) so that a
+    display only needs to redraw those spots.
+
+    If event_log is set (see the eventlog module), the world also reports
+    everything that happens in it (moves, meals, matings, births, fights and
+    so on) to it, so that a run can be replayed later without redoing it.
+
+    All of the world's randomness, including that of its critters and their
+    fights, comes from generators seeded with the world's seed, so two worlds
+    with the same seed and critters play out exactly the same way.
+    """
+
+    def __init__(self, width, height, food_probability, seed=None,
+                 food_coma_period=None, food_comma_sleep_time=None,
+                 gestation_period=None):
+        """
+        Initializes our world to have the given dimensions, with each spot
+        in the world having a food_probability chance of containing food.
+
+        If seed is None, a random seed is picked (and kept in self.seed so
+        the run can be repeated later).
+
+        food_coma_period, food_comma_sleep_time and gestation_period set how
+        this world's critters eat, sleep and mate. Any that aren't given are
+        taken from the module constants of the same names.
+
+        The world starts out without any critters: use the add_critter method
+        to start populating the world.
+        """
+        self.width = width
+        self.height = height
+        self.food_probability = food_probability
+
+        # (the parameters hide the module constants of the same names)
+        if food_coma_period is None:
+            food_coma_period = globals()["food_coma_period"]
+        if food_comma_sleep_time is None:
+            food_comma_sleep_time = globals()["food_comma_sleep_time"]
+        if gestation_period is None:
+            gestation_period = globals()["gestation_period"]
+        self.food_coma_period = food_coma_period
+        self.food_comma_sleep_time = food_comma_sleep_time
+        self.gestation_period = gestation_period
+
+        # the row or column next to each row or column, wrapping around the
+        # edges of the world
+        self.north_of = [(y - 1) % height for y in range(height)]
+        self.south_of = [(y + 1) % height for y in range(height)]
+        self.east_of = [(x + 1) % width for x in range(width)]
+        self.west_of = [(x - 1) % width for x in range(width)]
+
+        # map from critter type to the str() of its critters, or None if that
+        # can change (see Critter.constant_str)
+        self.type_names = {}
+
+        if seed is None:
+            seed = random.SystemRandom().randrange(2**32)
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.np_random = np.random.default_rng(seed)
+
+        self.changed_spots = None
+        self.event_log = None
+        self.food_growth = None
+        self.clear()
+
+    def clear(self):
+        """
+        Clears the world, resetting everything back to an initial state.
+        """
+        # each spot in the world will have food_probability chance of having food
+        self.food_grid = \
+            self.np_random.random((self.height, self.width)) < \
+            self.food_probability
+        self.num_food = int(np.count_nonzero(self.food_grid))
+        self.occupant_grid = np.full((self.height, self.width), -1,
+                                     dtype=np.int32)
+
+        self.critter_id = {} # map critter to its id
+        self.critter_by_id = [] # map id to critter (None for unused ids)
+        self.free_ids = [] # ids that can be given to new critters
+
+        # the turn being done (or last done, between turns). Set by the
+        # simulation at the start of each turn.
+        self.clock = 0
+
+        # the critter table, indexed by critter id: their type ids, where
+        # they are, the turn they wake up on (they're asleep until the clock
+        # reaches it), the turn they stop mating on, how much they have
+        # eaten, how many moves they have decided on (see
+        # Critter.moves_decided) and their flags. The critters waking up and
+        # done mating on each turn are also kept on timer wheels, so that a
+        # turn only has to look at them.
+        capacity = 64
+        self.critter_type = np.zeros(capacity, dtype=np.int32)
+        self.critter_x = np.zeros(capacity, dtype=np.int32)
+        self.critter_y = np.zeros(capacity, dtype=np.int32)
+        self.wake_turn = np.zeros(capacity, dtype=np.int64)
+        self.mating_until = np.zeros(capacity, dtype=np.int64)
+        self.amount_eaten = np.zeros(capacity, dtype=np.int32)
+        self.moves_decided = np.zeros(capacity, dtype=np.int64)
+        self.critter_flags = np.zeros(capacity, dtype=np.uint8)
+        self.waking = TimerWheel()
+        self.done_mating = TimerWheel()
+
+        # every critter class in the world is registered (see register_type)
+        # and given a small integer id, its type id, in the order they came
+        self.critter_types = [] # map type id to class
+        self.type_id = {} # map class to type id
+        self.type_id_by_name = {} # map class name to type id
+
+        # per-type arrays, indexed by type id: how many critters of that type
+        # are alive, how much they've eaten and how many fights they've won
+        self.num_alive = np.zeros(0, dtype=np.int64)
+        self.num_eaten = np.zeros(0, dtype=np.int64)
+        self.num_wins = np.zeros(0, dtype=np.int64)
+
+        # start with no critters and every spot in the world is open
+        self.critters = []
+        self.open_spots = OpenSpots(self.width, self.height, self.random)
+
+        if self.changed_spots is not None:
+            self.changed_spots = set()
+        if self.food_growth is not None:
+            self.food_growth.clear()
+
+    def watch_changes(self):
+        """
+        Starts keeping track of which spots in the world change. Until this
+        is called, changes aren't tracked so they cost nothing.
+        """
+        if self.changed_spots is None:
+            self.changed_spots = set()
+
+    def stop_watching_changes(self):
+        """ Stops keeping track of which spots in the world change. """
+        self.changed_spots = None
+
+    def take_changed_spots(self):
+        """
+        Returns the set of (x, y) spots that have changed since the last call
+        to this method (or to watch_changes), and forgets about them.
+        """
+        changed = self.changed_spots
+        self.changed_spots = set()
+        return changed
+
+    def _changed_critters(self, critter_ids):
+        """ Marks the spots of the critters with the given ids as changed. """
+        self.changed_spots.update(zip(self.critter_x[critter_ids].tolist(),
+                                      self.critter_y[critter_ids].tolist()))
+
+    def _new_id(self):
+        """
+        Returns an unused critter id, making room in the per-critter arrays
+        if needed.
+        """
+        if self.free_ids:
+            return self.free_ids.pop()
+
+        new_id = len(self.critter_by_id)
+        self.critter_by_id.append(None)
+        if new_id == len(self.wake_turn):
+            # double the size of the table, with the new rows looking like
+            # an awake, non-mating critter that hasn't eaten
+            capacity = 2 * new_id
+            for name in critter_table:
+                column = np.zeros(capacity, dtype=getattr(self, name).dtype)
+                column[:new_id] = getattr(self, name)
+                setattr(self, name, column)
+        return new_id
+
+    def register_type(self, critter_type):
+        """
+        Registers the given critter class with the world, if it isn't
+        already, and returns its type id.
+        """
+        type_id = self.type_id.get(critter_type)
+        if type_id is None:
+            type_id = len(self.critter_types)
+            self.critter_types.append(critter_type)
+            self.type_id[critter_type] = type_id
+            self.type_id_by_name.setdefault(critter_type.__name__, type_id)
+            self.num_alive = np.append(self.num_alive, 0)
+            self.num_eaten = np.append(self.num_eaten, 0)
+            self.num_wins = np.append(self.num_wins, 0)
+        return type_id
+
+    def get_stats(self, critter_type):
+        """
+        Returns a tuple of (alive, kills, eaten) for the given critter type,
+        which can be a class or the name of one, e.g. "Cow". Types that were
+        never in the world have no stats yet, so get all zeros.
+        """
+        if isinstance(critter_type, str):
+            type_id = self.type_id_by_name.get(critter_type)
+        else:
+            type_id = self.type_id.get(critter_type)
+        if type_id is None:
+            return 0, 0, 0
+        return int(self.num_alive[type_id]), int(self.num_wins[type_id]), \
+            int(self.num_eaten[type_id])
+
+    def food_remaining(self):
+        """ Returns how many spots in the world have food. """
+        return self.num_food
+
+    def add_food(self, spots):
+        """
+        Puts food in the given spots (an array of spot numbers, y * width +
+        x), where there isn't any already.
+        """
+        food = self.food_grid.ravel()
+        spots = np.unique(spots[~food[spots]])
+        food[spots] = True
+        self.num_food += len(spots)
+        if self.changed_spots is not None or self.event_log is not None:
+            for spot in spots.tolist():
+                location = (spot % self.width, spot // self.width)
+                if self.changed_spots is not None:
+                    self.changed_spots.add(location)
+                if self.event_log is not None:
+                    self.event_log.food_grew(*location)
+
+    def get_open_spot(self):
+        """
+        Returns a random open spot in the world, or None if the world is full.
+        The spot stays open until a critter is added there.
+        """
+        return self.open_spots.choice()
+
+    def get_closest_open_spot(self, x, y):
+        """
+        Returns the open spot in the world closest to the given location, or
+        None if the world is full.
+        """
+        return self.open_spots.closest(x % self.width, y % self.height)
+
+    def add_critter(self, critter, location):
+        """ Places a new critter in the world at the given location. """
+        type_id = self.type_id.get(type(critter))
+        if type_id is None:
+            type_id = self.register_type(type(critter))
+        critter_id = self._new_id()
+        self.critter_id[critter] = critter_id
+        self.critter_by_id[critter_id] = critter
+        self.critter_type[critter_id] = type_id
+        self.critter_x[critter_id] = location[0]
+        self.critter_y[critter_id] = location[1]
+        self.moves_decided[critter_id] = critter._moves_decided
+        self.critter_flags[critter_id] = alive_flag
+        critter._world = self
+        critter.random = self.random
+        self.critters.append(critter)
+        self.occupant_grid[location[1], location[0]] = critter_id
+        self.open_spots.remove(location)
+        if self.changed_spots is not None:
+            self.changed_spots.add(location)
+        self.num_alive[type_id] += 1
+
+    def food_at(self, x, y):
+        """ Returns True if there is food at the given location, False
+        otherwise. """
+        x = x % self.width
+        y = y % self.height
+        return bool(self.food_grid[y, x])
+
+    def feed_critter(self, critter, x, y):
+        """
+        Feeds the given critter the food at the given location.
+
+        Returns True if the critter fell asleep because of eating, False
+        otherwise.
+        """
+        x = x % self.width
+        y = y % self.height
+        if not self.food_grid[y, x]:
+            raise RuntimeError("Tried removing food where there was none.")
+        else:
+            critter_id = self.critter_id[critter]
+            self.num_eaten[self.critter_type[critter_id]] += 1
+            self.food_grid[y, x] = False
+            self.num_food -= 1
+            if self.food_growth is not None:
+                self.food_growth.eaten(y * self.width + x)
+            self.amount_eaten[critter_id] += 1
+            if self.changed_spots is not None:
+                self.changed_spots.add((x, y))
+            if self.event_log is not None:
+                self.event_log.ate(critter_id)
+
+            if self.amount_eaten[critter_id] % self.food_coma_period == 0:
+                # sleep for the rest of this turn and the next
+                # food_comma_sleep_time turns
+                wake_turn = self.clock + self.food_comma_sleep_time + 1
+                self.wake_turn[critter_id] = wake_turn
+                self.waking.schedule(wake_turn, critter_id)
+                if self.event_log is not None:
+                    self.event_log.fell_asleep(critter_id)
+                return True
+            else:
+                return False
+
+    def rest_critters(self):
+        """
+        Wakes up the critters that have slept long enough by this turn.
+
+        Critters wake up by themselves once the clock reaches their
+        wake_turn, so all that's left to do is note where they are.
+        """
+        waking = self.waking.pop(self.clock)
+        if waking and self.changed_spots is not None:
+            # a critter that died since falling asleep isn't waking up
+            waking = np.array(waking)
+            self._changed_critters(
+                waking[self.wake_turn[waking] == self.clock])
+
+    def mate_critters(self, mother, father):
+        """
+        Marks two critters as mating, setting one as the mother and the
+        other as the father. The mother is the critter that spawn off the baby
+        at the end of the gestation period.
+        """
+        mother_id = self.critter_id[mother]
+        father_id = self.critter_id[father]
+        self.critter_flags[mother_id] |= pregnant_flag
+        # mate for the rest of this turn and the next gestation_period turns
+        mating_until = self.clock + self.gestation_period + 1
+        self.mating_until[mother_id] = mating_until
+        self.mating_until[father_id] = mating_until
+        self.done_mating.schedule(mating_until, mother_id)
+        self.done_mating.schedule(mating_until, father_id)
+        if self.changed_spots is not None:
+            self._changed_critters([mother_id, father_id])
+        if self.event_log is not None:
+            self.event_log.mated(mother_id, father_id)
+
+    def gestate_critters(self):
+        """
+        Marks mating critters as having gestated for an additional turn.
+
+        If they have been gestating long enough, they a new baby critter will
+        be formed.
+        """
+        # each mother whose time is up adds a new baby critter to the world,
+        # as close to her as possible. If the world is full there is nowhere
+        # to put the baby, so it isn't born.
+        for mother_id in self.advance_gestation():
+            critter = self.critter_by_id[mother_id]
+            location = self.get_closest_open_spot(
+                int(self.critter_x[mother_id]), int(self.critter_y[mother_id]))
+            if location is None:
+                continue
+            self.add_critter(critter.spawn(location), location)
+            if self.event_log is not None:
+                self.event_log.born(mother_id, *location)
+
+    def advance_gestation(self):
+        """
+        Ends the mating of the critters that have mated long enough by this
+        turn, without any babies being born.
+
+        Returns a sorted array of the ids of the mothers whose time is up.
+        """
+        done = np.array(self.done_mating.pop(self.clock), dtype=np.int64)
+        # a critter that died since it started mating isn't done
+        done = done[self.mating_until[done] == self.clock]
+        if self.changed_spots is not None:
+            self._changed_critters(done)
+
+        flags = self.critter_flags
+        mothers = np.unique(done[(flags[done] & pregnant_flag) != 0])
+        flags[mothers] ^= pregnant_flag
+        return mothers
+
+    def get_critter(self, x, y):
+        """ Returns the critter at the given location, or None if one isn't
+        there. """
+        x = x % self.width
+        y = y % self.height
+        critter_id = self.occupant_grid[y, x]
+        if critter_id == -1:
+            return None
+        return self.critter_by_id[critter_id]
+
+    def name_of(self, critter):
+        """
+        Returns str(critter), working it out just once per type of critter
+        when the type has a constant_str.
+        """
+        critter_type = type(critter)
+        try:
+            name = self.type_names[critter_type]
+        except KeyError:
+            name = str(critter) if critter_type.constant_str else None
+            self.type_names[critter_type] = name
+        return str(critter) if name is None else name
+
+    def name_at(self, x, y):
+        """
+        Returns the name of the critter at the given (already wrapped)
+        location, or None if one isn't there.
+        """
+        critter_id = self.occupant_grid[y, x]
+        if critter_id == -1:
+            return None
+        return self.name_of(self.critter_by_id[critter_id])
+
+    def move_critter(self, critter, new_x, new_y):
+        """ Move the given critter to the given location. """
+        new_x = new_x % self.width
+        new_y = new_y % self.height
+
+        critter_id = self.critter_id[critter]
+        curr_x = int(self.critter_x[critter_id])
+        curr_y = int(self.critter_y[critter_id])
+        self.open_spots.add((curr_x, curr_y))
+        self.open_spots.remove((new_x, new_y))
+        self.occupant_grid[new_y, new_x] = critter_id
+        self.occupant_grid[curr_y, curr_x] = -1
+        self.critter_x[critter_id] = new_x
+        self.critter_y[critter_id] = new_y
+        critter.move_to(new_x, new_y)
+        if self.changed_spots is not None:
+            self.changed_spots.add((curr_x, curr_y))
+            self.changed_spots.add((new_x, new_y))
+        if self.event_log is not None:
+            self.event_log.moved(critter_id, new_x, new_y)
+
+    def remove_critter(self, critter):
+        """ Remove this critter from the world, for its time has come. """
+        critter_id = self.critter_id[critter]
+        curr_x = int(self.critter_x[critter_id])
+        curr_y = int(self.critter_y[critter_id])
+        self.open_spots.add((curr_x, curr_y))
+        self.occupant_grid[curr_y, curr_x] = -1
+        self.detach_critter(critter)
+        if self.changed_spots is not None:
+            self.changed_spots.add((curr_x, curr_y))
+
+    def detach_critter(self, critter):
+        """
+        Marks the given critter as dead, for when its spot has already been
+        given up (remove_critter does both). It stays in the critter table
+        until it is buried.
+        """
+        critter_id = self.critter_id[critter]
+        self.critter_flags[critter_id] = 0
+        # the critter keeps its last location and move count once it's out
+        # of the world
+        critter._world = None
+        critter._x = int(self.critter_x[critter_id])
+        critter._y = int(self.critter_y[critter_id])
+        critter._moves_decided = int(self.moves_decided[critter_id])
+
+    def bury_critter(self, critter):
+        """ Remove all traces of critter from the world. """
+        self.bury_critters([critter])
+
+    def bury_critters(self, dead_critters):
+        """
+        Remove all traces of the given critters from the world.
+
+        Each critter takes constant time to bury, plus one pass over the list
+        of critters at the end, so bury everyone who died in a turn at once.
+        """
+        if not dead_critters:
+            return
+
+        dead_ids = [self.critter_id.pop(critter) for critter in dead_critters]
+        for critter_id in dead_ids:
+            self.critter_by_id[critter_id] = None
+        self.free_ids.extend(dead_ids)
+
+        self.num_alive -= np.bincount(self.critter_type[dead_ids],
+                                      minlength=len(self.num_alive))
+
+        # reset the critters' rows in the table so their ids can be reused
+        self.wake_turn[dead_ids] = 0
+        self.mating_until[dead_ids] = 0
+        self.amount_eaten[dead_ids] = 0
+        self.moves_decided[dead_ids] = 0
+        self.critter_flags[dead_ids] = 0
+
+        critter_id = self.critter_id
+        self.critters = [c for c in self.critters if c in critter_id]
+
+    def record_wins(self, winners):
+        """ Adds a fight win for each of the given critters' types. """
+        if winners:
+            critter_id = self.critter_id
+            winner_ids = [critter_id[c] for c in winners]
+            self.num_wins += np.bincount(self.critter_type[winner_ids],
+                                         minlength=len(self.num_wins))
+
+    def is_alive(self, critter):
+        """
+        Returns True if the critter is still in the world, False if it has
+        been removed (even if it hasn't been buried yet).
+        """
+        critter_id = self.critter_id.get(critter)
+        return critter_id is not None and \
+            bool(self.critter_flags[critter_id] & alive_flag)
+
+    def is_sleeping(self, critter):
+        """ Returns True if the critter is sleeping, False otherwise. """
+        return self.clock < self.wake_turn[self.critter_id[critter]]
+
+    def is_mating(self, critter):
+        """ Returns True if the critter is mating, False otherwise. """
+        return self.clock < self.mating_until[self.critter_id[critter]]
+
+    def get_location(self, critter):
+        """ Returns the location of the critter in the world. """
+        critter_id = self.critter_id[critter]
+        return int(self.critter_x[critter_id]), int(self.critter_y[critter_id])
+
+
+def battle(critter1, critter2, rng=random, c1_attack=None, c2_attack=None):
+    """
+    Performs a fight between two critters, breaking ties with the given
+    random number generator (anything with a random() method, like a
+    CoinFlips). Either critter's attack can be given if it has already been
+    decided; otherwise the critter is asked for it.
+
+    Returns a tuple of (winner, loser).
+    """
+
+    if c1_attack is None:
+        c1_attack = critter1.fight(str(critter2))
+    if c2_attack is None:
+        c2_attack = critter2.fight(str(critter1))
+
+    outcome = _outcome_rows[c1_attack.value][c2_attack.value]
+    if outcome == 0:
+        outcome = 1 if rng.random() < 0.5 else -1
+    if outcome > 0:
+        return critter1, critter2
+    else:
+        return critter2, critter1
+
+
+class CoinFlips:
+    """
+    Hands out uniform random numbers in [0, 1) from a NumPy Generator,
+    drawing them a block at a time. It has the same random() method as the
+    random module, so battle can use it to break ties.
+    """
+
+    block_size = 1024
+
+    def __init__(self, np_random):
+        self.np_random = np_random
+        self.numbers = []
+
+    def random(self):
+        if not self.numbers:
+            self.numbers = self.np_random.random(self.block_size).tolist()
+        return self.numbers.pop()
+
+
+class Simulation:
+    """
+    Runs turns of a World without any display attached.
+
+    Anything that wants to know when a turn finishes (e.g. the GUI redrawing
+    the world and its stats) registers itself with add_observer.
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.turn_number = 0
+        self.observers = []
+
+        # every critter is shown its neighbors through this same view
+        self.neighbors = Neighbors(world)
+
+        # random numbers for breaking ties in fights
+        self.coin_flips = CoinFlips(world.np_random)
+
+        # the moves and attacks batch policies have decided on this turn, as
+        # lists of codes indexed by critter id (0 if undecided), or None if
+        # no one has batch policies
+        self.planned_moves = None
+        self.planned_attacks = None
+
+        # set to a metrics.Metrics to have each turn's stats and the time
+        # taken by each of its phases recorded
+        self.metrics = None
+
+        # set to a sandbox.Sandbox to have every call into critter code
+        # timed and limited
+        self.sandbox = None
+
+    def add_observer(self, observer):
+        """
+        Registers a function to be called with this simulation after each
+        turn is done.
+        """
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        """ Stops notifying the given observer about turns. """
+        self.observers.remove(observer)
+
+    def populate(self, critter_types, num_each_type):
+        """
+        Create and randomly place num_each_type critters of each of the given
+        critter classes, alternating between the classes.
+        """
+        for critter_type in critter_types:
+            self.world.register_type(critter_type)
+        for i in range(num_each_type * len(critter_types)):
+            critter_loc = self.world.get_open_spot()
+            if critter_loc is None:
+                raise RuntimeError(
+                    "World is too small for that many critters.")
+            critter = critter_types[i % len(critter_types)](critter_loc)
+            self.world.add_critter(critter, critter_loc)
+
+    def notify_observers(self):
+        """ Tells every observer about the current state of the simulation. """
+        for observer in self.observers:
+            observer(self)
+
+    def run(self, num_turns=None, time_limit=None, notify_every=None):
+        """
+        Performs turns of the simulation as fast as possible, stopping after
+        num_turns turns or once time_limit seconds have passed, whichever
+        comes first. Leaving both out runs forever.
+
+        Observers are only told about every notify_every'th turn (going by
+        turn_number) and the final turn, rather than about every turn.
+
+        Returns the number of turns that were done.
+        """
+        if time_limit is not None:
+            deadline = time.perf_counter() + time_limit
+
+        turns_done = 0
+        notified = True
+        while num_turns is None or turns_done < num_turns:
+            self.do_turn(notify=False)
+            turns_done += 1
+            notified = False
+
+            if notify_every and self.turn_number % notify_every == 0:
+                self.notify_observers()
+                notified = True
+            if time_limit is not None and time.perf_counter() >= deadline:
+                break
+
+        if not notified:
+            self.notify_observers()
+        return turns_done
+
+    def plan_batch_decisions(self):
+        """
+        Has each type of critter with batch policies decide the moves and
+        attacks of all its critters for this turn (see Critter.get_moves).
+        """
+        world = self.world
+        batch_types = [(type_id, critter_type) for type_id, critter_type
+                       in enumerate(world.critter_types)
+                       if critter_type.get_moves is not None or
+                       critter_type.fights is not None]
+        if not batch_types:
+            self.planned_moves = self.planned_attacks = None
+            return
+
+        # find each type's critters in the critter table, in id order
+        num_ids = len(world.critter_by_id)
+        alive = (world.critter_flags[:num_ids] & alive_flag).astype(bool)
+        type_ids = world.critter_type[:num_ids]
+
+        capacity = len(world.wake_turn)
+        planned_moves = np.zeros(capacity, dtype=np.int8)
+        planned_attacks = np.zeros(capacity, dtype=np.int8)
+        for type_id, critter_type in batch_types:
+            ids = np.flatnonzero(alive & (type_ids == type_id))
+            ids = ids.astype(np.int32)
+            if not len(ids):
+                continue
+            if critter_type.fights is not None:
+                batch = Batch(world, None, ids)
+                if self.sandbox is None:
+                    planned_attacks[ids] = critter_type.fights(batch)
+                else:
+                    planned_attacks[ids] = \
+                        self.sandbox.fights(critter_type, batch)
+            if critter_type.get_moves is not None:
+                awake = (world.wake_turn[ids] <= world.clock) & \
+                    (world.mating_until[ids] <= world.clock)
+                batch = Batch(world, None, ids[awake])
+                if self.sandbox is None:
+                    planned_moves[batch.ids] = critter_type.get_moves(batch)
+                else:
+                    planned_moves[batch.ids] = \
+                        self.sandbox.get_moves(critter_type, batch)
+
+        # the turn looks these up one critter at a time, which is quicker
+        # with lists than with arrays
+        self.planned_moves = planned_moves.tolist()
+        self.planned_attacks = planned_attacks.tolist()
+
+    def planned_attack(self, critter):
+        """
+        Returns the attack a batch policy decided on for the given critter's
+        first fight this turn (using it up), or None if there isn't one.
+        """
+        if self.planned_attacks is None:
+            return None
+        critter_id = self.world.critter_id[critter]
+        code = self.planned_attacks[critter_id]
+        if not code:
+            return None
+        self.planned_attacks[critter_id] = 0
+        return attacks_by_code[code]
+
+    def choose_attack(self, critter, opponent):
+        """
+        Returns the attack the given critter uses against opponent: the one
+        its batch policy planned, if any, or else the one it picks.
+        """
+        attack = self.planned_attack(critter)
+        if attack is None:
+            if self.sandbox is None:
+                attack = critter.fight(str(opponent))
+            else:
+                attack = self.sandbox.fight(critter, str(opponent))
+        return attack
+
+    def do_turn(self, notify=True):
+        """
+        Performs a single turn of the simulation, telling the observers about
+        it unless notify is False.
+        """
+        world = self.world
+        world.clock = self.turn_number
+        event_log = world.event_log
+        sandbox = self.sandbox
+
+        # when recording metrics, time each phase of the turn (deciding and
+        # fighting happen critter by critter, so add those up as we go)
+        metrics = self.metrics
+        if metrics is not None:
+            clock = time.perf_counter
+            start = clock()
+
+        if world.food_growth is not None:
+            world.food_growth.grow(world, self.turn_number)
+        if metrics is not None:
+            grown = clock()
+        world.rest_critters()
+        if metrics is not None:
+            rested = clock()
+        world.gestate_critters()
+        if metrics is not None:
+            gestated = clock()
+        self.plan_batch_decisions()
+        planned_moves = self.planned_moves
+        if metrics is not None:
+            decide_time = clock() - gestated
+            combat_time = 0.0
+
+        # look each critter up in the critter table just once. No critters
+        # are added during the rest of the turn, so the table's arrays stay
+        # the same ones.
+        critter_ids = world.critter_id
+        critter_flags = world.critter_flags
+        critter_x = world.critter_x
+        critter_y = world.critter_y
+        wake_turn = world.wake_turn
+        mating_until = world.mating_until
+        moves_decided = world.moves_decided
+        turn_number = self.turn_number
+
+        dead_critters = []
+        winners = []
+        for critter in world.critters:
+            critter_id = critter_ids[critter]
+            if not critter_flags[critter_id] & alive_flag:
+                continue
+            elif turn_number < wake_turn[critter_id] or \
+                    turn_number < mating_until[critter_id]:
+                continue
+
+            # check if there's food at the critter's location
+            curr_x = int(critter_x[critter_id])
+            curr_y = int(critter_y[critter_id])
+            if world.food_grid[curr_y, curr_x]:
+                # if critter wants to eat, feed it
+                if sandbox is None:
+                    wants_food = critter.eat()
+                else:
+                    wants_food = sandbox.eat(critter)
+                if wants_food:
+                    fell_asleep = world.feed_critter(critter, curr_x, curr_y)
+                    if fell_asleep:
+                        continue
+
+            # Determine who this critter's neighbors are so we can give this
+            # information to them when they are going to decide how to move.
+            move_code = 0
+            if planned_moves is not None:
+                move_code = planned_moves[critter_id]
+            if move_code:
+                move = directions_by_code[move_code]
+            else:
+                neighbors = self.neighbors
+                neighbors.x = curr_x
+                neighbors.y = curr_y
+                if metrics is not None:
+                    decide_start = clock()
+                if sandbox is None:
+                    move = critter.get_move(neighbors)
+                else:
+                    move = sandbox.get_move(critter, neighbors)
+                if metrics is not None:
+                    decide_time += clock() - decide_start
+            moves_decided[critter_id] += 1
+
+            if move == Direction.NORTH:
+                dest_x, dest_y = curr_x, world.north_of[curr_y]
+            elif move == Direction.EAST:
+                dest_x, dest_y = world.east_of[curr_x], curr_y
+            elif move == Direction.SOUTH:
+                dest_x, dest_y = curr_x, world.south_of[curr_y]
+            elif move == Direction.WEST:
+                dest_x, dest_y = world.west_of[curr_x], curr_y
+            else:
+                # Critter didn't want to move so nothing left to do
+                continue
+
+            other_critter = world.get_critter(dest_x, dest_y)
+            if other_critter == None:
+                world.move_critter(critter, dest_x, dest_y)
+            else:
+                if type(critter) != type(other_critter):
+                    # battle if they are different critter types
+                    if metrics is not None:
+                        combat_start = clock()
+                    if not world.is_sleeping(other_critter):
+                        attack = self.choose_attack(critter, other_critter)
+                        other_attack = self.choose_attack(other_critter,
+                                                          critter)
+                        winner, loser = battle(
+                            critter, other_critter, self.coin_flips,
+                            attack, other_attack)
+                    else:
+                        # if other critter was sleeping, they automatically
+                        # lose
+                        attack = other_attack = None
+                        winner, loser = critter, other_critter
+                    if metrics is not None:
+                        combat_time += clock() - combat_start
+
+                    if event_log is not None:
+                        event_log.fought(critter_id,
+                                         critter_ids[other_critter],
+                                         attack, other_attack,
+                                         winner is critter)
+
+                    winners.append(winner)
+                    dead_critters.append(loser)
+                    world.remove_critter(loser)
+
+                else:
+                    # there is another critter of the same type here.
+                    if not world.is_mating(other_critter):
+                        world.mate_critters(critter, other_critter)
+                    continue
+
+        if metrics is not None:
+            looped = clock()
+        world.record_wins(winners)
+        world.bury_critters(dead_critters)
+
+        self.turn_number += 1
+        if metrics is not None:
+            done = clock()
+            metrics.record_turn(food=grown - start, rest=rested - grown,
+                                gestate=gestated - rested,
+                                decide=decide_time, combat=combat_time,
+                                bury=done - looped, turn=done - start)
+        if event_log is not None:
+            event_log.turn_done(self)
+
+        if notify:
+            self.notify_observers()
+
+
+def total_points(alive, kills, eaten):
+    """ Returns the number of points earned for the given stats. """
+    return alive + kills + eaten
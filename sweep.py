@@ -0,0 +1,311 @@
+"""
+Module: sweep
+
+Searches for good settings of the constants that shape a Critters ecology:
+how much food there is (food_probability), how often critters fall asleep
+from eating (food_coma_period) and for how long (food_comma_sleep_time),
+and how long mating takes (gestation_period).
+
+Each setting is run with several seeds, in parallel. Runs that have
+obviously gone wrong (a type of critter has died out, or the world has
+filled up) are stopped early instead of being played out to the end, and
+every result is cached by its configuration and seed, so running a study
+again, or one that overlaps it, only runs what is new.
+
+A run's score is how balanced it was: the points of the worst type of
+critter over those of the best, so 1 if every type did equally well, and 0
+for runs that were stopped early.
+
+Examples:
+    python sweep.py --gestation-period 20 40 80 --food-probability 0.02 0.05
+    python sweep.py --food-coma-period 1 2 3 4 --seeds 16 --tune
+"""
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import simulation
+from simulation import World, Simulation, total_points
+from tournament import confidence_interval
+from benchmark import parse_size
+
+# the settings a sweep can vary, and the values they have when not given
+parameters = ("food_probability", "food_coma_period",
+              "food_comma_sleep_time", "gestation_period")
+default_food_probability = 0.05
+
+# runs are checked every check_every turns, and stopped if a type of critter
+# has died out or (after min_turns, since crowds can thin out again) more
+# than full_fraction of the world is covered in critters
+check_every = 50
+min_turns = 300
+full_fraction = 0.99
+
+
+def settle(config):
+    """
+    Returns a copy of the given configuration with every parameter it
+    leaves out set to its default.
+    """
+    config = dict(config)
+    config.setdefault("food_probability", default_food_probability)
+    for name in parameters[1:]:
+        if config.get(name) is None:
+            config[name] = getattr(simulation, name)
+    return config
+
+
+def config_grid(base, **values):
+    """
+    Returns a list of configurations, one for every combination of the
+    given values of the parameters, each a copy of base with those set.
+
+    base is a configuration like tournament.config_grid makes, without the
+    seed: "width", "height", "num_each_type", "critter_types" and
+    "num_turns". For example:
+        config_grid(base, gestation_period=[20, 40, 80],
+                    food_probability=[0.02, 0.05])
+    """
+    for name in values:
+        if name not in parameters:
+            raise ValueError("Unknown parameter %s." % name)
+    configs = []
+    for combination in itertools.product(*values.values()):
+        config = dict(base)
+        config.update(zip(values, combination))
+        configs.append(settle(config))
+    return configs
+
+
+def run_config(config):
+    """
+    Runs the given configuration, which includes a seed, stopping early if
+    the run goes wrong.
+
+    Returns a dictionary with the configuration, the seed, the number of
+    "turns" run, how the run "ended" ("done", "extinct" or "full") and the
+    "stats" of each type of critter, like tournament.run_match.
+    """
+    config = settle(config)
+    world = World(config["width"], config["height"],
+                  config["food_probability"], config["seed"],
+                  config["food_coma_period"], config["food_comma_sleep_time"],
+                  config["gestation_period"])
+    sim = Simulation(world)
+    sim.populate(config["critter_types"], config["num_each_type"])
+    type_ids = [world.type_id[t] for t in config["critter_types"]]
+    full = full_fraction * world.width * world.height
+
+    ended = "done"
+    while sim.turn_number < config["num_turns"]:
+        sim.run(min(check_every, config["num_turns"] - sim.turn_number))
+        if not world.num_alive[type_ids].all():
+            ended = "extinct"
+            break
+        if sim.turn_number >= min_turns and len(world.critters) > full:
+            ended = "full"
+            break
+
+    stats = {}
+    for critter_type in config["critter_types"]:
+        alive, kills, eaten = world.get_stats(critter_type)
+        stats[critter_type.__name__] = (alive, kills, eaten,
+                                        total_points(alive, kills, eaten))
+    return {"config": config, "seed": world.seed, "turns": sim.turn_number,
+            "ended": ended, "stats": stats}
+
+
+def cache_key(config):
+    """
+    Returns the string a configuration's results are cached under: all of
+    its settings, its seed, and the module and name of each of its critter
+    types.
+    """
+    config = settle(config)
+    config["critter_types"] = ["%s.%s" % (t.__module__, t.__qualname__)
+                               for t in config["critter_types"]]
+    return json.dumps(config, sort_keys=True)
+
+
+class ResultCache:
+    """
+    Results of runs, by configuration and seed (see cache_key).
+
+    Given a path, the cache is kept in that file, one JSON object per line,
+    so that it lasts from one sweep to the next. The critters' code isn't
+    part of the key, so delete the file after changing them (or the rules
+    of the game).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.results = {} # map cache key to result, minus the configuration
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # cut off when a sweep was interrupted
+                    self.results[entry["key"]] = entry["result"]
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, config):
+        """
+        Returns the cached result of running the given configuration, or
+        None if it hasn't been run.
+        """
+        result = self.results.get(cache_key(config))
+        if result is None:
+            return None
+        result = dict(result, config=settle(config))
+        result["stats"] = {name: tuple(stats)
+                           for name, stats in result["stats"].items()}
+        return result
+
+    def add(self, result):
+        """ Caches the given result of run_config. """
+        key = cache_key(result["config"])
+        result = {name: value for name, value in result.items()
+                  if name != "config"}
+        self.results[key] = result
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"key": key, "result": result}) + "\n")
+
+
+def sweep(configs, seeds, cache=None, max_workers=None):
+    """
+    Runs every one of the given configurations with every one of the given
+    seeds, spread over max_workers processes (by default, one per core),
+    except for the runs already in the cache.
+
+    Returns a list of the results, a list per configuration with a result
+    per seed.
+    """
+    if cache is None:
+        cache = ResultCache()
+    runs = [dict(config, seed=seed) for config in configs for seed in seeds]
+    results = [cache.get(run) for run in runs]
+    to_run = [i for i, result in enumerate(results) if result is None]
+    if to_run:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for i, result in zip(to_run, executor.map(
+                    run_config, [runs[i] for i in to_run])):
+                cache.add(result)
+                results[i] = result
+    return [results[i:i + len(seeds)]
+            for i in range(0, len(results), len(seeds))]
+
+
+def balance(result):
+    """
+    Returns how balanced the given run was: the points of the worst type of
+    critter over those of the best, or 0 if the run was stopped early.
+    """
+    if result["ended"] != "done":
+        return 0.0
+    points = [stats[3] for stats in result["stats"].values()]
+    if not max(points):
+        return 0.0
+    return min(points) / max(points)
+
+
+def rank(configs, results, score=balance):
+    """
+    Returns a list of (configuration, (mean, margin), endings) for the given
+    configurations and their results (as returned by sweep), best first,
+    where mean +/- margin is a confidence interval for the configuration's
+    mean score and endings counts how its runs ended.
+    """
+    ranking = []
+    for config, config_results in zip(configs, results):
+        endings = {}
+        for result in config_results:
+            endings[result["ended"]] = endings.get(result["ended"], 0) + 1
+        ranking.append((config, confidence_interval(
+            [score(result) for result in config_results]), endings))
+    ranking.sort(key=lambda entry: entry[1][0], reverse=True)
+    return ranking
+
+
+def tune(configs, seeds, score=balance, cache=None, max_workers=None):
+    """
+    Finds the best of the given configurations by successive halving: every
+    configuration is run with the first seed, then the better half of them
+    with the first two, the better half of those with the first four, and
+    so on until one configuration is left or every seed has been used.
+
+    Returns the ranking (see rank) of the configurations in the last round.
+    """
+    if cache is None:
+        cache = ResultCache()
+    num_seeds = 1
+    while True:
+        round_seeds = seeds[:num_seeds]
+        ranking = rank(configs, sweep(configs, round_seeds, cache,
+                                      max_workers), score)
+        if len(configs) == 1 or len(round_seeds) == len(seeds):
+            return ranking
+        configs = [config for config, _, _ in
+                   ranking[:max(1, len(ranking) // 2)]]
+        num_seeds *= 2
+
+
+def print_ranking(ranking):
+    """ Prints a ranking of configurations, one per line. """
+    for config, (mean, margin), endings in ranking:
+        settings = "  ".join("%s %s" % (name, config[name])
+                             for name in parameters)
+        print("%s  balance %.3f +/- %-6.3f %s" %
+              (settings, mean, margin,
+               "  ".join("%s %d" % item for item in sorted(endings.items()))))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--size", type=parse_size, default=(60, 50),
+                        metavar="WxH")
+    parser.add_argument("--num-each-type", type=int, default=25)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--seeds", type=int, default=10,
+                        help="number of seeds to run each setting with")
+    for name in parameters:
+        parser.add_argument("--" + name.replace("_", "-"), nargs="+",
+                            type=float if name == "food_probability" else int,
+                            help="values of %s to try" % name)
+    parser.add_argument("--tune", action="store_true",
+                        help="narrow down to the best setting by successive "
+                             "halving instead of running every seed of "
+                             "every setting")
+    parser.add_argument("--cache", default="sweep_cache.jsonl",
+                        help="file to keep results in between sweeps")
+    parser.add_argument("--workers", type=int,
+                        help="number of processes to run (default: one per "
+                             "core)")
+    args = parser.parse_args(args)
+
+    import critters
+    base = {"width": args.size[0], "height": args.size[1],
+            "num_each_type": args.num_each_type,
+            "critter_types": tuple(critters.critter_types),
+            "num_turns": args.turns}
+    values = {name: getattr(args, name) for name in parameters
+              if getattr(args, name) is not None}
+    configs = config_grid(base, **values)
+    seeds = list(range(args.seeds))
+    cache = ResultCache(args.cache)
+
+    if args.tune:
+        ranking = tune(configs, seeds, cache=cache, max_workers=args.workers)
+    else:
+        ranking = rank(configs, sweep(configs, seeds, cache, args.workers))
+    print_ranking(ranking)
+
+
+if __name__ == "__main__":
+    main()
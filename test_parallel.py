@@ -0,0 +1,149 @@
+"""
+Module: test_parallel
+
+Checks that a ParallelSimulation plays out the same way however many
+workers it has, and that the event logs it writes replay exactly.
+
+    python -m unittest test_parallel
+"""
+import os
+import tempfile
+import unittest
+
+import critters
+import eventlog
+import parallel
+import replay
+from sandbox import Sandbox
+from simulation import World, Critter, Direction, Attack
+
+
+class Moody(Critter):
+    """
+    A critter whose name, moves and meals depend on a mood that changes as
+    it goes, and that shares a list with its mother and babies.
+    """
+    inherited_fields = ("seen",)
+
+    def __init__(self, location):
+        super().__init__(location)
+        self.mood = 0
+        self.seen = []
+
+    def __str__(self):
+        return "M%d" % (self.mood % 3)
+
+    def get_move(self, neighbors):
+        self.mood += 1
+        if not any(neighbors.values()):
+            return self.random.choice(list(Direction))
+        return Direction(1 + self.mood % 4)
+
+    def eat(self):
+        return self.mood % 2 == 0
+
+    def fight(self, opponent):
+        self.mood += len(opponent)
+        self.seen.append(opponent)
+        return self.random.choice(list(Attack))
+
+    def move_to(self, x, y):
+        super().move_to(x, y)
+        self.last_move = (x, y)
+
+
+def snapshot(sim):
+    """ Returns everything about the simulation's world worth comparing. """
+    world = sim.world
+    num_ids = len(world.critter_by_id)
+    names = [None if critter is None else type(critter).__name__
+             for critter in world.critter_by_id]
+    return (sim.turn_number, world.occupant_grid.tobytes(),
+            world.food_grid.tobytes(), names,
+            world.wake_turn[:num_ids].tobytes(),
+            world.mating_until[:num_ids].tobytes(),
+            world.critter_flags[:num_ids].tobytes(),
+            world.num_alive.tolist(), world.num_eaten.tolist(),
+            world.num_wins.tolist())
+
+
+def run(max_workers, num_turns, log_path=None):
+    """
+    Runs a small seeded world in a ParallelSimulation with the given number
+    of workers.
+
+    Returns the snapshot taken after each turn (and before the first), by
+    turn number, and the mood, number of moves decided, last move_to and
+    location of each Moody critter at the end.
+    """
+    world = World(40, 30, 0.3, seed=9)
+    sim = parallel.ParallelSimulation(world, tile_size=10,
+                                      max_workers=max_workers)
+    sim.populate([critters.Cow, Moody, critters.ScaredCat], 60)
+    log = None
+    if log_path is not None:
+        log = eventlog.EventLog(sim, log_path, keyframe_every=40)
+    snapshots = {sim.turn_number: snapshot(sim)}
+    try:
+        for _ in range(num_turns):
+            sim.do_turn()
+            snapshots[sim.turn_number] = snapshot(sim)
+    finally:
+        if log is not None:
+            log.close()
+        sim.close()
+
+    moodies = [(critter.mood, critter.moves_decided,
+                getattr(critter, "last_move", None),
+                world.get_location(critter))
+               for critter in world.critters if isinstance(critter, Moody)]
+    return snapshots, moodies
+
+
+class ParallelSimulationTest(unittest.TestCase):
+    num_turns = 120
+
+    def test_same_results_for_any_number_of_workers(self):
+        snapshots, moodies = run(1, self.num_turns)
+        for max_workers in (2, 3):
+            other_snapshots, other_moodies = run(max_workers, self.num_turns)
+            for turn_number, turn_snapshot in snapshots.items():
+                self.assertEqual(other_snapshots[turn_number], turn_snapshot,
+                                 "turn %d with %d workers" %
+                                 (turn_number, max_workers))
+            self.assertEqual(other_moodies, moodies)
+
+    def test_critters_are_told_about_their_moves(self):
+        _, moodies = run(2, self.num_turns)
+        moved = [(last_move, location)
+                 for _, _, last_move, location in moodies
+                 if last_move is not None]
+        self.assertTrue(moved)
+        for last_move, location in moved:
+            self.assertEqual(last_move, location)
+
+    def test_event_log_replays_exactly(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.log")
+            snapshots, _ = run(2, self.num_turns, path)
+            played = replay.Replay(path)
+            while played.turn_number < played.last_turn:
+                played.do_turn()
+                self.assertEqual(snapshot(played),
+                                 snapshots[played.turn_number])
+            for turn_number in (5, 80, 41, self.num_turns):
+                played.seek(turn_number)
+                self.assertEqual(snapshot(played), snapshots[turn_number])
+            played.data.close()
+
+    def test_sandbox_is_refused(self):
+        sim = parallel.ParallelSimulation(World(20, 20, 0.3, seed=1),
+                                          max_workers=1)
+        with self.assertRaises(RuntimeError):
+            Sandbox(sim)
+        self.assertIsNone(sim.sandbox)
+        sim.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
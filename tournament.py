@@ -0,0 +1,162 @@
+"""
+Module: tournament
+
+Runs lots of headless Critters matches in parallel, one per combination of
+settings and seed, and summarizes how each type of critter did.
+
+Run this module directly to hold a small tournament between the critters
+in the critters module.
+"""
+import itertools
+import math
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+from sandbox import Sandbox
+from simulation import World, Simulation, total_points
+
+
+def config_grid(world_sizes, food_probabilities, nums_each_type, seeds,
+                lineups, num_turns=1000, budget=None):
+    """
+    Returns a list of match configurations, one for every combination of
+    the given world sizes ((width, height) tuples), food probabilities,
+    numbers of each type of critter, seeds, and lineups (sequences of
+    critter classes).
+
+    If budget is given, every call into a critter's code is limited to that
+    many seconds (see the sandbox module).
+    """
+    configs = []
+    for size, food_probability, num_each_type, lineup, seed in \
+            itertools.product(world_sizes, food_probabilities,
+                              nums_each_type, lineups, seeds):
+        configs.append({"width": size[0], "height": size[1],
+                        "food_probability": food_probability,
+                        "num_each_type": num_each_type,
+                        "critter_types": tuple(lineup),
+                        "num_turns": num_turns,
+                        "seed": seed,
+                        "budget": budget})
+    return configs
+
+
+def run_match(config):
+    """
+    Runs a single match with the given configuration (see config_grid).
+
+    Returns a dictionary with the configuration, the seed the world used, and
+    a "stats" dictionary that maps each critter type's name to its (alive,
+    kills, eaten, points). Running the same configuration again gives the
+    same result, unless it has a budget that some critter only sometimes
+    goes over.
+
+    Matches with a budget also have "costs", the report of what each
+    critter type's calls cost (see Sandbox.report).
+    """
+    world = World(config["width"], config["height"],
+                  config["food_probability"], config["seed"])
+    sim = Simulation(world)
+    sim.populate(config["critter_types"], config["num_each_type"])
+    sandbox = None
+    if config.get("budget") is not None:
+        sandbox = Sandbox(sim, config["budget"])
+    sim.run(config["num_turns"])
+
+    stats = {}
+    for critter_type in config["critter_types"]:
+        alive, kills, eaten = world.get_stats(critter_type)
+        stats[critter_type.__name__] = (alive, kills, eaten,
+                                        total_points(alive, kills, eaten))
+    result = {"config": config, "seed": world.seed, "stats": stats}
+    if sandbox is not None:
+        result["costs"] = sandbox.report()
+        sandbox.close()
+    return result
+
+
+def run_tournament(configs, max_workers=None):
+    """
+    Runs a match for each of the given configurations, spread over
+    max_workers processes (by default, one per core).
+
+    Returns the list of match results, in the same order as configs.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run_match, configs))
+
+
+def confidence_interval(values, confidence=0.95):
+    """
+    Returns (mean, margin) for the given values, where mean +/- margin is an
+    approximate confidence interval for the true mean (using the normal
+    distribution, so it's only trustworthy with a decent number of values).
+    """
+    mean = statistics.fmean(values)
+    if len(values) < 2:
+        return mean, math.inf
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    return mean, z * statistics.stdev(values) / math.sqrt(len(values))
+
+
+def matchup_key(config):
+    """
+    Returns what identifies the matchup a configuration belongs to, i.e.
+    everything about it except the seed.
+    """
+    return (config["width"], config["height"], config["food_probability"],
+            config["num_each_type"], config["num_turns"],
+            tuple(t.__name__ for t in config["critter_types"]))
+
+
+def aggregate(results, confidence=0.95):
+    """
+    Combines the results of matches that differ only by seed.
+
+    Returns a dictionary mapping each matchup_key to a dictionary that maps
+    each critter type's name to a dictionary with the number of matches and
+    the (mean, margin) confidence interval of its "alive", "kills", "eaten"
+    and "points".
+    """
+    grouped = {}
+    for result in results:
+        matchup = grouped.setdefault(matchup_key(result["config"]), {})
+        for name, stats in result["stats"].items():
+            matchup.setdefault(name, []).append(stats)
+
+    summary = {}
+    for key, matchup in grouped.items():
+        summary[key] = {}
+        for name, all_stats in matchup.items():
+            type_summary = {"matches": len(all_stats)}
+            for i, stat in enumerate(("alive", "kills", "eaten", "points")):
+                type_summary[stat] = confidence_interval(
+                    [stats[i] for stats in all_stats], confidence)
+            summary[key][name] = type_summary
+    return summary
+
+
+def print_summary(summary):
+    """ Prints an aggregated tournament summary, one matchup at a time. """
+    for key, matchup in summary.items():
+        width, height, food_probability, num_each_type, num_turns, _ = key
+        print("%dx%d world, food %.2f, %d of each type, %d turns" %
+              (width, height, food_probability, num_each_type, num_turns))
+        ranking = sorted(matchup.items(),
+                         key=lambda item: item[1]["points"][0], reverse=True)
+        for name, type_summary in ranking:
+            print("  %-12s" % name, end="")
+            for stat in ("alive", "kills", "eaten", "points"):
+                mean, margin = type_summary[stat]
+                print("  %s %8.1f +/- %-6.1f" % (stat, mean, margin), end="")
+            print("  (%d matches)" % type_summary["matches"])
+
+
+if __name__ == "__main__":
+    import critters
+    configs = config_grid(world_sizes=[(60, 50)],
+                          food_probabilities=[0.05],
+                          nums_each_type=[25],
+                          seeds=range(100),
+                          lineups=[critters.critter_types])
+    print_summary(aggregate(run_tournament(configs)))